@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Approximate nearest-neighbour search for the docrag VectorDB.
+
+IVFVectorDB has the same add/query API as vocab.VectorDB, but partitions the
+normalized embeddings into n_lists clusters with spherical k-means (an
+inverted-file index). A query is only scored against the nprobe clusters whose
+centroids are closest to it, so nprobe trades recall for latency.
+"""
+
+import math
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class IVFVectorDB:
+    def __init__(self, n_lists: Optional[int] = None, nprobe: int = 8,
+                 min_index_size: int = 1024, seed: int = 0):
+        """
+        n_lists: number of k-means clusters (default: sqrt of the corpus size)
+        nprobe: number of clusters scanned per query (the recall/latency knob)
+        min_index_size: below this many entries queries are answered exactly
+        """
+        if n_lists is not None and n_lists < 1:
+            raise ValueError("n_lists must be at least 1.")
+        if nprobe < 1:
+            raise ValueError("nprobe must be at least 1.")
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.min_index_size = min_index_size
+        self.seed = seed
+
+        self.texts: List[str] = []
+        self._matrix: Optional[np.ndarray] = None  # normalized rows, grown by doubling
+        self._size = 0
+
+        # Index state: rows [0, _indexed) are clustered, later rows are pending
+        self._indexed = 0
+        self._centroids: Optional[np.ndarray] = None
+        self._list_offsets: Optional[np.ndarray] = None  # list i is [off[i], off[i+1])
+        self._list_rows: Optional[np.ndarray] = None     # row ids grouped by list
+        self._list_matrix: Optional[np.ndarray] = None   # embeddings in list order
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, text: str, embedding: Sequence[float]):
+        """Add a text and its embedding to the database."""
+        row = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(row))
+        if norm == 0:
+            return
+
+        if self._matrix is None:
+            self._matrix = np.zeros((16, len(row)), dtype=np.float32)
+        if len(row) != self._matrix.shape[1]:
+            raise ValueError("Embedding dimension does not match the database.")
+        if self._size == len(self._matrix):
+            grown = np.zeros((2 * len(self._matrix), self._matrix.shape[1]), dtype=np.float32)
+            grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+
+        self._matrix[self._size] = row / norm
+        self.texts.append(text)
+        self._size += 1
+
+    def build_index(self, iterations: int = 10):
+        """Cluster all entries with spherical k-means and build the inverted lists."""
+        data = self._matrix[:self._size]
+        n_lists = self.n_lists or max(1, int(math.sqrt(self._size)))
+        n_lists = min(n_lists, self._size)
+        rng = np.random.default_rng(self.seed)
+
+        # Train on a sample; ~64 points per centroid is plenty for k-means
+        sample_size = min(self._size, 64 * n_lists)
+        sample = data[rng.choice(self._size, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty clusters keep their previous centroid
+            filled = norms[:, 0] > 0
+            centroids[filled] = sums[filled] / norms[filled]
+
+        assign = self._assign(data, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=n_lists)
+
+        self._centroids = centroids
+        self._list_rows = order
+        self._list_offsets = np.concatenate(([0], np.cumsum(counts)))
+        self._list_matrix = data[order]
+        self._indexed = self._size
+
+    def _assign(self, data: np.ndarray, centroids: np.ndarray, block: int = 8192) -> np.ndarray:
+        """Return the nearest centroid for each row, in blocks to bound memory."""
+        assign = np.empty(len(data), dtype=np.int64)
+        for start in range(0, len(data), block):
+            assign[start:start + block] = np.argmax(data[start:start + block] @ centroids.T, axis=1)
+        return assign
+
+    def _normalize_query(self, query_emb: Sequence[float]) -> Optional[np.ndarray]:
+        query = np.asarray(query_emb, dtype=np.float32)
+        norm = float(np.linalg.norm(query))
+        if norm == 0 or self._size == 0:
+            return None
+        return query / norm
+
+    @staticmethod
+    def _top_k(rows: np.ndarray, scores: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        if len(scores) > top_k:
+            part = np.argpartition(-scores, top_k - 1)[:top_k]
+            rows, scores = rows[part], scores[part]
+        order = np.argsort(-scores, kind="stable")
+        return [(int(rows[i]), float(scores[i])) for i in order]
+
+    def exact_query(self, query_emb: Sequence[float], top_k: int = 3) -> List[Tuple[str, float]]:
+        """Brute-force cosine similarity against every entry."""
+        return [(self.texts[row], score) for row, score in self._exact_rows(query_emb, top_k)]
+
+    def _exact_rows(self, query_emb: Sequence[float], top_k: int) -> List[Tuple[int, float]]:
+        query = self._normalize_query(query_emb)
+        if query is None:
+            return []
+        scores = self._matrix[:self._size] @ query
+        return self._top_k(np.arange(self._size), scores, top_k)
+
+    def query(self, query_emb: Sequence[float], top_k: int = 3) -> List[Tuple[str, float]]:
+        """Find (approximately) the top_k most similar entries to the query embedding."""
+        return [(self.texts[row], score) for row, score in self._ann_rows(query_emb, top_k)]
+
+    def _ensure_index(self):
+        """(Re)build the index once more than half of the entries are not in it."""
+        if self._size >= self.min_index_size and 2 * self._indexed < self._size:
+            self.build_index()
+
+    def _ann_rows(self, query_emb: Sequence[float], top_k: int) -> List[Tuple[int, float]]:
+        if self._size < self.min_index_size:
+            return self._exact_rows(query_emb, top_k)
+        self._ensure_index()
+
+        query = self._normalize_query(query_emb)
+        if query is None:
+            return []
+
+        # Scan the nprobe closest lists plus any rows added since the last build
+        centroid_scores = self._centroids @ query
+        nprobe = min(self.nprobe, len(centroid_scores))
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        offsets = self._list_offsets
+        ranges = [(offsets[i], offsets[i + 1]) for i in probe]
+
+        rows = np.concatenate([self._list_rows[a:b] for a, b in ranges] +
+                              [np.arange(self._indexed, self._size)])
+        scores = np.concatenate([self._list_matrix[a:b] @ query for a, b in ranges] +
+                                [self._matrix[self._indexed:self._size] @ query])
+        return self._top_k(rows, scores, top_k)
+
+    def measure_recall(self, query_embs: Sequence[Sequence[float]], top_k: int = 3) -> dict:
+        """
+        Compare the approximate query path against exact brute-force search.
+
+        Returns mean recall@top_k and the average latency (ms) of both paths.
+        A pending index build happens before timing starts, so ann_ms does not
+        include k-means training.
+        """
+        self._ensure_index()
+        recalls = []
+        exact_time = 0.0
+        ann_time = 0.0
+        for query_emb in query_embs:
+            start = time.perf_counter()
+            exact = self._exact_rows(query_emb, top_k)
+            exact_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            approx = self._ann_rows(query_emb, top_k)
+            ann_time += time.perf_counter() - start
+
+            if exact:
+                found = {row for row, _ in approx}
+                recalls.append(sum(row in found for row, _ in exact) / len(exact))
+
+        n = max(len(recalls), 1)
+        return {
+            "recall": sum(recalls) / n,
+            "queries": len(recalls),
+            "exact_ms": 1000 * exact_time / n,
+            "ann_ms": 1000 * ann_time / n,
+        }
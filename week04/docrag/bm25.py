@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Lexical retrieval for docrag: an inverted index ranked with BM25.
+
+Each term keeps a postings list of (doc id, term frequency) sorted by doc id,
+plus the statistics needed for an upper bound on the term's BM25 contribution.
+Queries are evaluated document-at-a-time with WAND: documents whose summed
+upper bounds cannot beat the current top-k threshold are skipped over with
+binary search, so a query only touches the postings of its own terms.
+"""
+
+import heapq
+import math
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+from vocab import tokenize
+
+
+class Postings:
+    """Postings list for one term."""
+    __slots__ = ("doc_ids", "tfs", "max_tf", "min_doc_len")
+
+    def __init__(self):
+        self.doc_ids = array('l')
+        self.tfs = array('l')
+        self.max_tf = 0
+        self.min_doc_len = 0
+
+    def append(self, doc_id: int, tf: int, doc_len: int):
+        self.doc_ids.append(doc_id)
+        self.tfs.append(tf)
+        self.max_tf = max(self.max_tf, tf)
+        self.min_doc_len = doc_len if len(self.doc_ids) == 1 else min(self.min_doc_len, doc_len)
+
+
+class _Cursor:
+    """Iterator state over one query term's postings during WAND."""
+    __slots__ = ("postings", "pos", "idf", "upper_bound")
+
+    def __init__(self, postings: Postings, idf: float, upper_bound: float):
+        self.postings = postings
+        self.pos = 0
+        self.idf = idf
+        self.upper_bound = upper_bound
+
+    @property
+    def doc(self) -> int:
+        return self.postings.doc_ids[self.pos]
+
+    def exhausted(self) -> bool:
+        return self.pos >= len(self.postings.doc_ids)
+
+    def seek(self, doc_id: int):
+        """Advance to the first posting with doc id >= doc_id."""
+        self.pos = bisect_left(self.postings.doc_ids, doc_id, self.pos)
+
+
+class InvertedIndex:
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.texts: List[str] = []
+        self.doc_lengths: List[int] = []
+        self.total_length = 0
+        self.postings: Dict[str, Postings] = {}
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def add(self, text: str):
+        """Add a text to the index. Doc ids are assigned in insertion order."""
+        doc_id = len(self.texts)
+        words = tokenize(text)
+        counts: Dict[str, int] = {}
+        for word in words:
+            counts[word] = counts.get(word, 0) + 1
+
+        for word, tf in counts.items():
+            postings = self.postings.get(word)
+            if postings is None:
+                postings = self.postings[word] = Postings()
+            postings.append(doc_id, tf, len(words))
+
+        self.texts.append(text)
+        self.doc_lengths.append(len(words))
+        self.total_length += len(words)
+
+    def idf(self, term: str) -> float:
+        """BM25 inverse document frequency (always positive)."""
+        df = len(self.postings[term].doc_ids)
+        n = len(self.texts)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def _term_score(self, idf: float, tf: int, doc_len: int, avg_len: float) -> float:
+        norm = self.k1 * (1.0 - self.b + self.b * doc_len / avg_len)
+        return idf * tf * (self.k1 + 1.0) / (tf + norm)
+
+    def query(self, text: str, top_k: int = 3) -> List[Tuple[str, float]]:
+        """Find the top_k texts by BM25 score for the query text."""
+        return [(self.texts[doc], score) for doc, score in self.query_ids(text, top_k)]
+
+    def query_ids(self, text: str, top_k: int = 3) -> List[Tuple[int, float]]:
+        """Like query, but returns (doc id, score) pairs."""
+        if not self.texts or top_k <= 0:
+            return []
+        avg_len = self.total_length / len(self.texts)
+
+        cursors = []
+        for term in set(tokenize(text)):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            idf = self.idf(term)
+            # tf-saturation grows with tf and shrinks with doc length, so the
+            # largest tf and shortest document bound every posting's score
+            upper_bound = self._term_score(idf, postings.max_tf, postings.min_doc_len, avg_len)
+            cursors.append(_Cursor(postings, idf, upper_bound))
+
+        heap: List[Tuple[float, int]] = []  # min-heap of (score, -doc id)
+        threshold = 0.0
+
+        while cursors:
+            cursors.sort(key=lambda c: c.doc)
+
+            # Pivot: first cursor at which the accumulated upper bounds beat the threshold
+            bound = 0.0
+            pivot = None
+            for i, cursor in enumerate(cursors):
+                bound += cursor.upper_bound
+                if bound > threshold:
+                    pivot = i
+                    break
+            if pivot is None:
+                break
+            pivot_doc = cursors[pivot].doc
+
+            if cursors[0].doc == pivot_doc:
+                # Every cursor on pivot_doc contributes; score it fully
+                score = 0.0
+                doc_len = self.doc_lengths[pivot_doc]
+                for cursor in cursors:
+                    if cursor.doc != pivot_doc:
+                        break
+                    tf = cursor.postings.tfs[cursor.pos]
+                    score += self._term_score(cursor.idf, tf, doc_len, avg_len)
+                    cursor.pos += 1
+
+                if len(heap) < top_k:
+                    heapq.heappush(heap, (score, -pivot_doc))
+                elif score > heap[0][0]:
+                    heapq.heapreplace(heap, (score, -pivot_doc))
+                if len(heap) == top_k:
+                    threshold = heap[0][0]
+            else:
+                # Documents before pivot_doc cannot make the top-k; skip them
+                for cursor in cursors[:pivot]:
+                    cursor.seek(pivot_doc)
+
+            cursors = [c for c in cursors if not c.exhausted()]
+
+        ranked = sorted(heap, reverse=True)
+        return [(-neg_doc, score) for score, neg_doc in ranked]
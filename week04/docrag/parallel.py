@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""Multi-process vocabulary building and embedding for docrag.
+
+build_store_parallel() indexes a text file with a process pool and writes the
+result in the store.py format:
+
+1. Vocabulary (map-reduce): the file is cut into byte shards at whitespace
+   boundaries; each worker tokenizes its shard and returns the set of words it
+   saw, and the parent merges the sets into the sorted vocabulary.
+2. Chunking: the parent streams iter_chunks() and keeps only each chunk's text
+   and byte offset; this pass does no tokenization.
+3. Embedding: workers receive batches of row numbers, read the chunks' byte
+   spans from the file themselves and write normalized bag-of-words rows into
+   a matrix in shared memory, so no vectors are pickled back to the parent.
+"""
+
+import os
+import time
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from store import save_matrix
+from vocab import iter_chunks, tokenize
+
+_WHITESPACE = b" \t\n\r\x0b\x0c"
+_READ_SIZE = 1 << 22
+
+# Per-worker state, set by _init_embed_worker
+_worker: Dict[str, object] = {}
+
+
+def _shard_ranges(filename: str, num_shards: int) -> List[Tuple[int, int]]:
+    """Split the file into about num_shards byte ranges that start and end on whitespace."""
+    size = os.path.getsize(filename)
+    step = max(1, size // num_shards)
+    bounds = [0]
+    with open(filename, 'rb') as f:
+        for target in range(step, size, step):
+            if target <= bounds[-1]:
+                continue
+            f.seek(target)
+            pos = target
+            # Move forward to the next whitespace byte so no word is cut in two
+            while True:
+                data = f.read(4096)
+                if not data:
+                    pos = size
+                    break
+                cut = next((i for i, b in enumerate(data) if b in _WHITESPACE), None)
+                if cut is not None:
+                    pos += cut
+                    break
+                pos += len(data)
+            if pos < size:
+                bounds.append(pos)
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _shard_words(args: Tuple[str, int, int]) -> Set[str]:
+    """Map step: the set of vocabulary words in one byte range of the file."""
+    filename, start, end = args
+    words: Set[str] = set()
+    carry = b""
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = carry + f.read(min(_READ_SIZE, remaining))
+            remaining -= len(data) - len(carry)
+            # Keep a trailing partial word for the next read
+            cut = max(data.rfind(c) for c in _WHITESPACE) + 1 if remaining > 0 else len(data)
+            if cut == 0:
+                carry = data
+                continue
+            words.update(tokenize(data[:cut].decode('utf-8', errors='replace')))
+            carry = data[cut:]
+    return words
+
+
+def build_vocabulary_parallel(filename: str, pool: Pool, jobs: int) -> Dict[str, int]:
+    """Create the same vocabulary as vocab.create_vocabulary using the pool."""
+    shards = _shard_ranges(filename, 4 * jobs)
+    words: Set[str] = set()
+    for shard_words in pool.imap_unordered(_shard_words, [(filename, a, b) for a, b in shards]):
+        words |= shard_words  # reduce step
+    return {word: idx for idx, word in enumerate(sorted(words))}
+
+
+def _init_embed_worker(filename: str, shm_name: str, shape: Tuple[int, int],
+                       vocabulary: Dict[str, int], offsets: List[int], file_size: int):
+    shm = SharedMemory(name=shm_name)
+    _worker.update(
+        shm=shm,
+        matrix=np.ndarray(shape, dtype=np.float32, buffer=shm.buf),
+        file=open(filename, 'rb'),
+        vocabulary=vocabulary,
+        offsets=offsets,
+        file_size=file_size,
+    )
+
+
+def _embed_rows(rows: Tuple[int, int]) -> int:
+    """Embed chunks [first, last) straight into the shared matrix."""
+    first, last = rows
+    matrix = _worker["matrix"]
+    vocabulary = _worker["vocabulary"]
+    offsets = _worker["offsets"]
+    f = _worker["file"]
+
+    # A chunk's span runs up to the next chunk's first word; the extra
+    # whitespace does not change its tokens
+    start = offsets[first]
+    end = offsets[last] if last < len(offsets) else _worker["file_size"]
+    f.seek(start)
+    data = f.read(end - start)
+
+    for row in range(first, last):
+        a = offsets[row] - start
+        b = (offsets[row + 1] if row + 1 < len(offsets) else end) - start
+        idx = [vocabulary[w] for w in tokenize(data[a:b].decode('utf-8', errors='replace'))
+               if w in vocabulary]
+        if not idx:
+            continue
+        np.add.at(matrix[row], idx, 1.0)
+        matrix[row] /= np.linalg.norm(matrix[row])
+    return last - first
+
+
+def build_store_parallel(filename: str, base: str, jobs: Optional[int] = None,
+                         chunk_size: int = 512, batch_size: int = 256) -> Dict[str, float]:
+    """
+    Index filename with a pool of jobs processes and save it to <base>.vdb/.chunks.
+
+    Returns the number of chunks, the vocabulary size and per-phase wall times.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    stats: Dict[str, float] = {}
+
+    with Pool(jobs) as pool:
+        start = time.perf_counter()
+        vocabulary = build_vocabulary_parallel(filename, pool, jobs)
+        stats["vocabulary_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    texts: List[str] = []
+    offsets: List[int] = []
+    for chunk, offset in iter_chunks(filename, chunk_size):
+        texts.append(chunk)
+        offsets.append(offset)
+    stats["chunking_s"] = time.perf_counter() - start
+
+    shape = (len(texts), len(vocabulary))
+    shm = SharedMemory(create=True, size=max(1, shape[0] * shape[1] * 4))
+    try:
+        matrix = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        matrix.fill(0.0)
+
+        start = time.perf_counter()
+        batches = [(i, min(i + batch_size, len(texts))) for i in range(0, len(texts), batch_size)]
+        init_args = (filename, shm.name, shape, vocabulary, offsets, os.path.getsize(filename))
+        with Pool(jobs, initializer=_init_embed_worker, initargs=init_args) as pool:
+            for _ in pool.imap_unordered(_embed_rows, batches):
+                pass
+        stats["embedding_s"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        save_matrix(matrix, texts, vocabulary, base)
+        stats["save_s"] = time.perf_counter() - start
+        del matrix
+    finally:
+        shm.close()
+        shm.unlink()
+
+    stats["chunks"] = len(texts)
+    stats["vocabulary_size"] = len(vocabulary)
+    return stats
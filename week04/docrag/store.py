@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""On-disk format for the docrag VectorDB, opened with mmap.
+
+save_vectordb(db, vocabulary, base) writes two files:
+
+  <base>.vdb     header | vocabulary table | float32 embedding matrix
+  <base>.chunks  header | uint64 offsets (n + 1) | UTF-8 chunk text blob
+
+All integers are little-endian. The .vdb header is
+
+  magic "DOCRAGV1", version u32, reserved u32, rows u64, dim u64,
+  vocabulary offset u64, vocabulary size u64, matrix offset u64
+
+and the vocabulary table is one (u16 length, UTF-8 bytes) record per word in
+index order. The matrix holds the normalized embeddings row by row and starts
+on a 64-byte boundary.
+
+load_vectordb(base) maps both files and returns a MappedVectorDB. Embeddings
+and chunk text stay in the page cache; only the vocabulary is turned into
+Python objects, so a query process starts in milliseconds.
+"""
+
+import mmap
+import struct
+from array import array
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from vocab import VectorDB, Embedding
+
+VDB_MAGIC = b"DOCRAGV1"
+CHUNKS_MAGIC = b"DOCRAGC1"
+VERSION = 1
+VDB_HEADER = struct.Struct("<8sIIQQQQQ")
+CHUNKS_HEADER = struct.Struct("<8sQ")
+ALIGNMENT = 64
+
+
+def _is_sparse(embedding: Embedding) -> bool:
+    # Checked by attribute rather than isinstance: when vocab.py runs as a
+    # script its SparseVector class lives in __main__, not in vocab.
+    return hasattr(embedding, "indices")
+
+
+def _pad(f, alignment: int = ALIGNMENT):
+    f.write(b"\0" * (-f.tell() % alignment))
+
+
+def save_vectordb(db: VectorDB, vocabulary: Dict[str, int], base: str):
+    """Write db and its vocabulary to <base>.vdb and <base>.chunks."""
+    dim = len(vocabulary)
+
+    def rows():
+        for _, embedding in db.entries:
+            row = np.zeros(dim, dtype="<f4")
+            if _is_sparse(embedding):
+                row[np.asarray(embedding.indices)] = np.asarray(embedding.values)
+            else:
+                row[:len(embedding)] = embedding
+            yield row
+
+    _write_store(base, vocabulary, [text for text, _ in db.entries], rows())
+
+
+def save_matrix(matrix: np.ndarray, texts: Sequence[str], vocabulary: Dict[str, int], base: str):
+    """Write a (len(texts), len(vocabulary)) matrix of normalized embeddings."""
+    if matrix.shape != (len(texts), len(vocabulary)):
+        raise ValueError("Matrix shape does not match the texts and vocabulary")
+    _write_store(base, vocabulary, texts, matrix)
+
+
+def _write_store(base: str, vocabulary: Dict[str, int], texts: Sequence[str],
+                 rows: Iterable[np.ndarray]):
+    dim = len(vocabulary)
+    words = sorted(vocabulary, key=vocabulary.get)
+
+    with open(f"{base}.vdb", "wb") as f:
+        f.write(b"\0" * VDB_HEADER.size)  # header is filled in once offsets are known
+        vocab_offset = f.tell()
+        for word in words:
+            encoded = word.encode("utf-8")
+            f.write(struct.pack("<H", len(encoded)))
+            f.write(encoded)
+        _pad(f)
+
+        matrix_offset = f.tell()
+        for row in rows:
+            f.write(np.asarray(row, dtype="<f4").tobytes())
+
+        f.seek(0)
+        f.write(VDB_HEADER.pack(VDB_MAGIC, VERSION, 0, len(texts), dim,
+                                vocab_offset, len(words), matrix_offset))
+
+    with open(f"{base}.chunks", "wb") as f:
+        offsets = array("Q", [0])
+        encoded_texts = []
+        for text in texts:
+            encoded = text.encode("utf-8")
+            encoded_texts.append(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+        f.write(CHUNKS_HEADER.pack(CHUNKS_MAGIC, len(texts)))
+        f.write(np.asarray(offsets, dtype="<u8").tobytes())
+        for encoded in encoded_texts:
+            f.write(encoded)
+
+
+class ChunkTexts:
+    """Read-only sequence of chunk texts, decoded on access from a mapped .chunks file."""
+
+    def __init__(self, mm: mmap.mmap):
+        magic, count = CHUNKS_HEADER.unpack_from(mm, 0)
+        if magic != CHUNKS_MAGIC:
+            raise ValueError("Not a docrag chunk file")
+        self._mm = mm
+        self._offsets = np.frombuffer(mm, dtype="<u8", count=count + 1, offset=CHUNKS_HEADER.size)
+        self._blob_start = CHUNKS_HEADER.size + 8 * (count + 1)
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> str:
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        start = self._blob_start + int(self._offsets[i])
+        end = self._blob_start + int(self._offsets[i + 1])
+        return self._mm[start:end].decode("utf-8")
+
+
+class MappedVectorDB:
+    """Query-only VectorDB backed by memory-mapped files from save_vectordb."""
+
+    def __init__(self, base: str):
+        with open(f"{base}.vdb", "rb") as f:
+            self._vdb_mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(f"{base}.chunks", "rb") as f:
+            self._chunks_mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, _, rows, dim,
+         vocab_offset, vocab_size, matrix_offset) = VDB_HEADER.unpack_from(self._vdb_mm, 0)
+        if magic != VDB_MAGIC or version != VERSION:
+            raise ValueError(f"{base}.vdb is not a version {VERSION} docrag vector file")
+
+        self.vocabulary = self._read_vocabulary(vocab_offset, vocab_size)
+        self.matrix = np.frombuffer(self._vdb_mm, dtype="<f4", count=rows * dim,
+                                    offset=matrix_offset).reshape(rows, dim)
+        self.texts = ChunkTexts(self._chunks_mm)
+        if len(self.texts) != rows:
+            raise ValueError(f"{base}.vdb and {base}.chunks disagree on the number of chunks")
+
+    def _read_vocabulary(self, offset: int, size: int) -> Dict[str, int]:
+        mm = self._vdb_mm
+        vocabulary = {}
+        for idx in range(size):
+            (length,) = struct.unpack_from("<H", mm, offset)
+            offset += 2
+            vocabulary[mm[offset:offset + length].decode("utf-8")] = idx
+            offset += length
+        return vocabulary
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def query(self, query_emb: Embedding, top_k: int = 3) -> List[Tuple[str, float]]:
+        """Find top_k most similar entries to the query embedding."""
+        rows, dim = self.matrix.shape
+        if rows == 0:
+            return []
+
+        if _is_sparse(query_emb):
+            # Only the columns of the query's non-zero terms are read
+            pairs = [(i, v) for i, v in zip(query_emb.indices, query_emb.values) if i < dim]
+            if not pairs:
+                return []
+            idx = np.array([i for i, _ in pairs], dtype=np.intp)
+            vals = np.array([v for _, v in pairs], dtype=np.float32)
+            scores = self.matrix[:, idx] @ vals
+            norm = query_emb.norm()
+        else:
+            query = np.zeros(dim, dtype=np.float32)
+            values = np.asarray(query_emb[:dim], dtype=np.float32)
+            query[:len(values)] = values
+            scores = self.matrix @ query
+            norm = float(np.linalg.norm(np.asarray(query_emb, dtype=np.float32)))
+        if norm == 0:
+            return []
+        scores = scores / norm
+
+        top_k = min(top_k, rows)
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.texts[int(i)], float(scores[i])) for i in top]
+
+    def close(self):
+        self.matrix = None
+        self.texts = None
+        self._vdb_mm.close()
+        self._chunks_mm.close()
+
+
+def load_vectordb(base: str) -> MappedVectorDB:
+    """Open a vector database written by save_vectordb."""
+    return MappedVectorDB(base)
@@ -3,32 +3,106 @@
 import sys
 import re
 import math
-from typing import List, Dict, Tuple
+import zlib
+import time
+import codecs
+import argparse
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator, List, Dict, Tuple, Union
+
+class SparseVector:
+    """A vector stored as parallel arrays of sorted indices and their non-zero values."""
+    __slots__ = ("indices", "values")
+
+    def __init__(self, indices: array, values: array):
+        self.indices = indices  # array('l'), strictly increasing
+        self.values = values    # array('d'), same length as indices
+
+    @classmethod
+    def from_counts(cls, counts: Dict[int, float]) -> "SparseVector":
+        """Build a sparse vector from an {index: value} mapping."""
+        indices = sorted(counts)
+        return cls(array('l', indices), array('d', (counts[i] for i in indices)))
+
+    def __len__(self) -> int:
+        """Number of stored (non-zero) entries."""
+        return len(self.indices)
+
+    def norm(self) -> float:
+        return math.sqrt(sum(x*x for x in self.values))
+
+    def scale(self, factor: float) -> "SparseVector":
+        return SparseVector(self.indices, array('d', (x*factor for x in self.values)))
+
+    def dot(self, other: Union["SparseVector", List[float]]) -> float:
+        """Dot product with another sparse vector or a dense list."""
+        if not isinstance(other, SparseVector):
+            return sum(v * other[i] for i, v in zip(self.indices, self.values) if i < len(other))
+
+        # Walk the shorter vector and binary-search its indices in the longer one
+        short, long = (self, other) if len(self) <= len(other) else (other, self)
+        total = 0.0
+        lo = 0
+        n = len(long.indices)
+        for i, v in zip(short.indices, short.values):
+            lo = bisect_left(long.indices, i, lo, n)
+            if lo == n:
+                break
+            if long.indices[lo] == i:
+                total += v * long.values[lo]
+        return total
+
+    def to_dense(self, dim: int) -> List[float]:
+        dense = [0.0] * dim
+        for i, v in zip(self.indices, self.values):
+            dense[i] = v
+        return dense
+
+Embedding = Union[List[float], SparseVector]
 
 class VectorDB:
     def __init__(self):
-        self.entries: List[Tuple[str, List[float]]] = []  # [(text, embedding)]
+        self.entries: List[Tuple[str, Embedding]] = []  # [(text, embedding)]
     
-    def add(self, text: str, embedding: List[float]):
-        """Add a text and its embedding to the database."""
+    def add(self, text: str, embedding: Embedding):
+        """Add a text and its embedding (dense list or SparseVector) to the database."""
         # Normalize the embedding vector
+        if isinstance(embedding, SparseVector):
+            norm = embedding.norm()
+            if norm > 0:
+                self.entries.append((text, embedding.scale(1/norm)))
+            return
         norm = math.sqrt(sum(x*x for x in embedding))
         if norm > 0:
             normalized_emb = [x/norm for x in embedding]
             self.entries.append((text, normalized_emb))
     
-    def cosine_similarity(self, v1: List[float], v2: List[float]) -> float:
+    def cosine_similarity(self, v1: Embedding, v2: Embedding) -> float:
         """Compute cosine similarity between two vectors."""
+        # vectors are already normalized
+        if isinstance(v1, SparseVector):
+            return v1.dot(v2)
+        if isinstance(v2, SparseVector):
+            return v2.dot(v1)
+        # zip stops at the shorter vector: embeddings made before the vocabulary
+        # grew are treated as zero in the newer dimensions
         dot_product = sum(a*b for a, b in zip(v1, v2))
-        return dot_product  # vectors are already normalized
+        return dot_product
     
-    def query(self, query_emb: List[float], top_k: int = 3) -> List[Tuple[str, float]]:
+    def query(self, query_emb: Embedding, top_k: int = 3) -> List[Tuple[str, float]]:
         """Find top_k most similar entries to the query embedding."""
         # Normalize query vector
-        norm = math.sqrt(sum(x*x for x in query_emb))
-        if norm == 0:
-            return []
-        normalized_query = [x/norm for x in query_emb]
+        if isinstance(query_emb, SparseVector):
+            norm = query_emb.norm()
+            if norm == 0:
+                return []
+            normalized_query = query_emb.scale(1/norm)
+        else:
+            norm = math.sqrt(sum(x*x for x in query_emb))
+            if norm == 0:
+                return []
+            normalized_query = [x/norm for x in query_emb]
         
         # Compute similarities
         similarities = [
@@ -39,11 +113,16 @@ class VectorDB:
         # Sort by similarity (highest first) and return top_k
         return sorted(similarities, key=lambda x: x[1], reverse=True)[:top_k]
 
+_NON_WORD_RE = re.compile(r'[^a-zA-Z0-9\s]')
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase the text, replace punctuation with spaces and split into words."""
+    return _NON_WORD_RE.sub(' ', text.lower()).split()
+
 def create_vocabulary(text: str) -> Dict[str, int]:
     """Create a vocabulary mapping from the entire text."""
     # Convert to lowercase and split into words
-    cleaned_text = re.sub(r'[^a-zA-Z0-9\s]', ' ', text.lower())
-    words = cleaned_text.split()
+    words = tokenize(text)
     
     # Create vocabulary (unique words)
     vocab = sorted(set(words))
@@ -53,6 +132,27 @@ def create_vocabulary(text: str) -> Dict[str, int]:
     
     return word_to_idx
 
+def build_vocabulary(chunks: Iterable[str]) -> Dict[str, int]:
+    """Create the same vocabulary as create_vocabulary, one chunk at a time."""
+    words = set()
+    for chunk in chunks:
+        words.update(tokenize(chunk))
+    return {word: idx for idx, word in enumerate(sorted(words))}
+
+def extend_vocabulary(vocabulary: Dict[str, int], chunks: Iterable[str]) -> List[str]:
+    """Add unseen words to vocabulary in place and return them.
+    
+    New words get the next free indices in order of first appearance; existing
+    indices never change, so embeddings already stored stay valid.
+    """
+    new_words = []
+    for chunk in chunks:
+        for word in tokenize(chunk):
+            if word not in vocabulary:
+                vocabulary[word] = len(vocabulary)
+                new_words.append(word)
+    return new_words
+
 def chunk_text(text: str, chunk_size: int = 512) -> List[str]:
     """Split text into chunks of approximately chunk_size bytes, preserving word boundaries."""
     words = text.split()
@@ -80,14 +180,69 @@ def chunk_text(text: str, chunk_size: int = 512) -> List[str]:
     
     return chunks
 
+_WORD_RE = re.compile(r'\S+')
+
+def iter_chunks(filename: str, chunk_size: int = 512,
+                buffer_size: int = 1 << 16) -> Iterator[Tuple[str, int]]:
+    """Stream the chunks chunk_text would produce for a file, with their byte offsets.
+    
+    The file is read buffer_size bytes at a time; a word cut off at the end of a
+    buffer is carried over to the next one. Yields (chunk, byte offset of the
+    chunk's first word in the file).
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    current_chunk: List[str] = []
+    current_size = 0
+    chunk_offset = 0
+    carry = ''        # partial word from the end of the previous buffer
+    carry_offset = 0  # byte offset of carry in the file
+    
+    with open(filename, 'rb') as f:
+        while True:
+            data = f.read(buffer_size)
+            final = not data
+            text = carry + decoder.decode(data, final=final)
+            
+            # Walk the words, converting character positions to byte offsets
+            char_pos, byte_pos = 0, carry_offset
+            carry = ''
+            for match in _WORD_RE.finditer(text):
+                byte_pos += len(text[char_pos:match.start()].encode('utf-8'))
+                char_pos = match.start()
+                word = match.group()
+                
+                if not final and match.end() == len(text):
+                    # The word may continue in the next buffer
+                    carry, carry_offset = word, byte_pos
+                    break
+                
+                word_size = len(word) + 1  # +1 for the space
+                if current_size + word_size > chunk_size and current_chunk:
+                    yield ' '.join(current_chunk), chunk_offset
+                    current_chunk = [word]
+                    current_size = word_size
+                    chunk_offset = byte_pos
+                else:
+                    if not current_chunk:
+                        chunk_offset = byte_pos
+                    current_chunk.append(word)
+                    current_size += word_size
+            else:
+                carry_offset = byte_pos + len(text[char_pos:].encode('utf-8'))
+            
+            if final:
+                break
+    
+    if current_chunk:
+        yield ' '.join(current_chunk), chunk_offset
+
 def create_bow_embedding(text: str, vocabulary: Dict[str, int]) -> List[float]:
     """Create a bag-of-words embedding for the text using the vocabulary."""
     # Initialize embedding vector with zeros
     embedding = [0.0] * len(vocabulary)
     
     # Clean text
-    cleaned_text = re.sub(r'[^a-zA-Z0-9\s]', ' ', text.lower())
-    words = cleaned_text.split()
+    words = tokenize(text)
     
     # Count words
     for word in words:
@@ -96,59 +251,236 @@ def create_bow_embedding(text: str, vocabulary: Dict[str, int]) -> List[float]:
             
     return embedding
 
-def main():
-    # Check if filename was provided
-    if len(sys.argv) != 2:
-        print("Usage: python vocab.py filename")
+def create_sparse_bow_embedding(text: str, vocabulary: Dict[str, int]) -> SparseVector:
+    """Create a bag-of-words embedding that only stores the words present in the text."""
+    counts: Dict[int, float] = {}
+    for word in tokenize(text):
+        idx = vocabulary.get(word)
+        if idx is not None:
+            counts[idx] = counts.get(idx, 0.0) + 1.0
+    return SparseVector.from_counts(counts)
+
+def query_saved_db(base: str, query: str, top_k: int = 2):
+    """Open a database written with --save and run one query against it."""
+    from store import load_vectordb
+    
+    start = time.perf_counter()
+    try:
+        db = load_vectordb(base)
+    except FileNotFoundError as e:
+        print(f"Error: {e.filename} not found")
+        sys.exit(1)
+    except ValueError as e:
+        print(f"Error: {e}")
         sys.exit(1)
+    print(f"Opened {len(db)} chunks, vocabulary size {len(db.vocabulary)} "
+          f"in {1000 * (time.perf_counter() - start):.2f} ms")
     
-    filename = sys.argv[1]
+    start = time.perf_counter()
+    results = db.query(create_sparse_bow_embedding(query, db.vocabulary), top_k=top_k)
+    print(f"Query took {1000 * (time.perf_counter() - start):.2f} ms")
+    print(f"\nTop {top_k} similar chunks:")
+    for text, similarity in results:
+        print(f"\nSimilarity: {similarity:.4f}")
+        print(f"Text: {text[:500]}...")
+
+def build_parallel(filename: str, base: str, jobs: int, query: str):
+    """Index filename with a process pool, save it to base and query the result."""
+    from parallel import build_store_parallel
     
     try:
-        # Read text from file
-        with open(filename, 'r') as f:
-            text = f.read()
+        stats = build_store_parallel(filename, base, jobs)
+    except FileNotFoundError:
+        print(f"Error: File '{filename}' not found")
+        sys.exit(1)
+    print(f"Indexed {stats['chunks']} chunks, vocabulary size {stats['vocabulary_size']} "
+          f"with {jobs} processes")
+    print(f"  vocabulary {stats['vocabulary_s']:.3f} s, chunking {stats['chunking_s']:.3f} s, "
+          f"embedding {stats['embedding_s']:.3f} s, save {stats['save_s']:.3f} s")
+    print(f"Saved vector database to {base}.vdb and {base}.chunks\n")
+    query_saved_db(base, query)
+
+def create_hashed_embedding(text: str, n_features: int = 1 << 18, ngrams: int = 1) -> SparseVector:
+    """Create a bag-of-words embedding with the hashing trick; no vocabulary is needed.
+    
+    Each word (and each run of up to ngrams consecutive words) is hashed with
+    CRC-32: the low bits pick one of n_features dimensions and the top bit
+    picks the sign, so colliding features tend to cancel instead of piling up.
+    """
+    words = tokenize(text)
+    counts: Dict[int, float] = {}
+    for n in range(1, ngrams + 1):
+        for i in range(len(words) - n + 1):
+            h = zlib.crc32(' '.join(words[i:i + n]).encode('utf-8'))
+            idx = h % n_features
+            counts[idx] = counts.get(idx, 0.0) + (-1.0 if h & 0x80000000 else 1.0)
+    return SparseVector.from_counts({i: v for i, v in counts.items() if v != 0.0})
+
+def main():
+    parser = argparse.ArgumentParser(description="Bag-of-words vector database demo")
+    parser.add_argument("filename", nargs="?", help="Text file to index")
+    parser.add_argument("--index", choices=["flat", "ivf"], default="flat",
+                        help="flat: exact search (default), ivf: approximate inverted-file index")
+    parser.add_argument("--nprobe", type=int, default=8,
+                        help="Number of IVF clusters scanned per query (default: 8)")
+    parser.add_argument("--n-lists", type=int, default=None,
+                        help="Number of IVF clusters (default: sqrt of the number of chunks)")
+    parser.add_argument("--bm25", action="store_true",
+                        help="Also build a BM25 inverted index and run the query lexically")
+    parser.add_argument("-q", "--query", default="file descriptor",
+                        help="Query text for the demo (default: 'file descriptor')")
+    parser.add_argument("--save", metavar="BASE",
+                        help="Save the vector database to BASE.vdb and BASE.chunks")
+    parser.add_argument("--load", metavar="BASE",
+                        help="Query a database saved with --save instead of indexing a file")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Build the database with N worker processes (requires --save)")
+    parser.add_argument("--hashing", action="store_true",
+                        help="Embed with feature hashing in a single pass, without a vocabulary")
+    parser.add_argument("--n-features", type=int, default=1 << 18,
+                        help="Dimension of hashed embeddings (default: 262144)")
+    parser.add_argument("--ngrams", type=int, default=1,
+                        help="Hash word n-grams up to this length (default: 1)")
+    parser.add_argument("--append", metavar="FILE", action="append", default=[],
+                        help="After indexing filename, add FILE without re-embedding "
+                             "existing chunks (may be repeated)")
+    args = parser.parse_args()
+    
+    if args.load:
+        query_saved_db(args.load, args.query)
+        return
+    if args.filename is None:
+        parser.error("a filename is required unless --load is given")
+    if args.hashing and (args.index != "flat" or args.save or args.jobs is not None):
+        parser.error("--hashing cannot be combined with --index ivf, --save or --jobs")
+    if args.append and (args.index != "flat" or args.jobs is not None):
+        parser.error("--append is only supported with --index flat and without --jobs")
+    if args.save and args.index != "flat":
+        parser.error("--save is only supported with --index flat")
+    if args.nprobe < 1:
+        parser.error("--nprobe must be at least 1")
+    if args.n_lists is not None and args.n_lists < 1:
+        parser.error("--n-lists must be at least 1")
+    if args.jobs is not None:
+        if not args.save:
+            parser.error("--jobs requires --save")
+        build_parallel(args.filename, args.save, args.jobs, args.query)
+        return
+    
+    filename = args.filename
+    
+    try:
+        # First pass: stream the file to create the global vocabulary
+        num_chunks = 0
+        def counted(chunks):
+            nonlocal num_chunks
+            for chunk, _ in chunks:
+                num_chunks += 1
+                yield chunk
+        if args.hashing:
+            # Hashed embeddings need no vocabulary, so there is only one pass
+            global_vocab = None
+        else:
+            global_vocab = build_vocabulary(counted(iter_chunks(filename)))
+            print("\nGlobal Vocabulary:")
+            print("=" * 50)
+            for word, idx in global_vocab.items():
+                print(f"{word}: {idx}")
+            print(f"\nTotal vocabulary size: {len(global_vocab)}")
         
-        # First, create global vocabulary
-        global_vocab = create_vocabulary(text)
-        print("\nGlobal Vocabulary:")
-        print("=" * 50)
-        for word, idx in global_vocab.items():
-            print(f"{word}: {idx}")
-        print(f"\nTotal vocabulary size: {len(global_vocab)}")
+        # Initialize vector database; the exact index stores sparse embeddings
+        if args.hashing:
+            db = VectorDB()
+            def embed(text: str, _vocabulary: None) -> SparseVector:
+                return create_hashed_embedding(text, args.n_features, args.ngrams)
+        elif args.index == "ivf":
+            from ann import IVFVectorDB
+            db = IVFVectorDB(n_lists=args.n_lists, nprobe=args.nprobe, min_index_size=0)
+            embed = create_bow_embedding
+        else:
+            db = VectorDB()
+            embed = create_sparse_bow_embedding
         
-        # Initialize vector database
-        db = VectorDB()
+        lexical_index = None
+        if args.bm25:
+            from bm25 import InvertedIndex
+            lexical_index = InvertedIndex()
         
-        # Split text into chunks and process each chunk
-        chunks = chunk_text(text)
-        print(f"\nProcessing text in {len(chunks)} chunks (~512 bytes each):")
+        # Second pass: stream the chunks again and embed each one
+        if args.hashing:
+            print("\nProcessing text in chunks (~512 bytes each):")
+        else:
+            print(f"\nProcessing text in {num_chunks} chunks (~512 bytes each):")
         print("=" * 50)
         
         # Process each chunk
-        for i, chunk in enumerate(chunks, 1):
+        recall_sample = []
+        for i, (chunk, _) in enumerate(iter_chunks(filename), 1):
+            num_chunks = i
             # Create embedding for chunk
-            embedding = create_bow_embedding(chunk, global_vocab)
+            embedding = embed(chunk, global_vocab)
             
             # Add to vector database
             db.add(chunk, embedding)
+            if lexical_index is not None:
+                lexical_index.add(chunk)
+            if args.index == "ivf" and len(recall_sample) < 100:
+                recall_sample.append(embedding)
             
             print(f"\nChunk {i} (size: {len(chunk)} bytes):")
             print("-" * 20)
             print("Text:", chunk[:100] + "..." if len(chunk) > 100 else chunk)
             
+        # Add further documents; only their own chunks are read and embedded
+        for extra_file in args.append:
+            start = time.perf_counter()
+            if global_vocab is None:
+                new_words = []
+            else:
+                new_words = extend_vocabulary(global_vocab, (c for c, _ in iter_chunks(extra_file)))
+            added = 0
+            for chunk, _ in iter_chunks(extra_file):
+                db.add(chunk, embed(chunk, global_vocab))
+                if lexical_index is not None:
+                    lexical_index.add(chunk)
+                added += 1
+            num_chunks += added
+            print(f"\nAppended {extra_file}: {added} chunks, {len(new_words)} new words "
+                  f"in {1000 * (time.perf_counter() - start):.2f} ms")
+            if global_vocab is not None:
+                print(f"Vocabulary size is now {len(global_vocab)}")
+        
         # Demonstrate vector database query
         print("\nVector Database Demo:")
         print("=" * 50)
         print("Querying with first chunk as example:")
-        test_query = "file descriptor"
-        if chunks:
-            query_emb = create_bow_embedding(test_query, global_vocab)
+        test_query = args.query
+        if num_chunks:
+            query_emb = embed(test_query, global_vocab)
             results = db.query(query_emb, top_k=2)
             print("\nTop 2 similar chunks:")
             for text, similarity in results:
                 print(f"\nSimilarity: {similarity:.4f}")
                 print(f"Text: {text[:500]}...")
+        
+        if lexical_index is not None and num_chunks:
+            print("\nTop 2 chunks by BM25:")
+            for text, score in lexical_index.query(test_query, top_k=2):
+                print(f"\nBM25 score: {score:.4f}")
+                print(f"Text: {text[:500]}...")
+        
+        if args.save:
+            from store import save_vectordb
+            save_vectordb(db, global_vocab, args.save)
+            print(f"\nSaved vector database to {args.save}.vdb and {args.save}.chunks")
+        
+        # Report how well the approximate index agrees with exact search
+        if args.index == "ivf" and num_chunks:
+            stats = db.measure_recall(recall_sample, top_k=2)
+            print(f"\nIVF recall@2 vs exact search (nprobe={args.nprobe}, "
+                  f"{stats['queries']} queries): {stats['recall']:.4f}")
+            print(f"Average query time: exact {stats['exact_ms']:.3f} ms, "
+                  f"ivf {stats['ann_ms']:.3f} ms")
             
     except FileNotFoundError:
         print(f"Error: File '{filename}' not found")
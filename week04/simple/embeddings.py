@@ -1,27 +1,30 @@
 # We'll define a simple global vocabulary for demonstration.
 # In practice, you might build the vocabulary from your entire corpus or use a more advanced tokenizer.
 
+from tokenizer import Vectorizer
+
 VOCABULARY = ["the", "cat", "dog", "apple", "banana", "run", "walk", "blue", "sky"]
 
 
+_VECTORIZER = Vectorizer(VOCABULARY)
+
 def text_to_bow(text):
     """
     Convert text to a simple Bag-of-Words vector based on the global VOCABULARY.
     text: string
     returns: list of integers, length == len(VOCABULARY)
     """
-    # Convert text to lowercase and split by whitespace for simplicity
-    tokens = text.lower().split()
-
-    # Initialize vector with zeros, one for each vocabulary word
-    bow_vector = [0] * len(VOCABULARY)
+    # Lowercase, strip punctuation and count words with a precompiled
+    # word -> index map (see tokenizer.py)
+    return _VECTORIZER.transform(text)
 
-    for word in tokens:
-        if word in VOCABULARY:
-            idx = VOCABULARY.index(word)
-            bow_vector[idx] += 1
-
-    return bow_vector
+def text_to_sparse_bow(text):
+    """
+    Like text_to_bow, but only stores the vocabulary words that occur.
+    text: string
+    returns: dict mapping vocabulary index -> count (missing indices are 0)
+    """
+    return _VECTORIZER.transform_sparse(text)
 
 def euclidean_distance(vec1, vec2):
     """
@@ -39,6 +42,19 @@ def euclidean_distance(vec1, vec2):
 
     return sum_of_squares ** 0.5
 
+def sparse_euclidean_distance(vec1, vec2):
+    """
+    Compute the Euclidean distance between two sparse vectors from text_to_sparse_bow.
+    Only the indices present in either vector contribute.
+    returns: float
+    """
+    sum_of_squares = 0.0
+    for idx in vec1.keys() | vec2.keys():
+        diff = vec1.get(idx, 0) - vec2.get(idx, 0)
+        sum_of_squares += diff * diff
+
+    return sum_of_squares ** 0.5
+
 # Example usage:
 if __name__ == "__main__":
     print()
@@ -68,3 +84,8 @@ if __name__ == "__main__":
     print("Distance(text3,text2) = ", euclidean_distance(text3_embedding, text2_embedding
 ))
 
+    print()
+    print("Sparse embedding of Text 1: ", text_to_sparse_bow(text1))
+    print("Sparse distance(text3,text1) = ",
+          sparse_euclidean_distance(text_to_sparse_bow(text3), text_to_sparse_bow(text1)))
+
@@ -1,19 +1,22 @@
 # 6_rag_example.py
 
+import sys
+import codecs
+
+from tokenizer import Vectorizer
+from vectordb import MatrixVectorDB
+
 ###################
 # 1) Bag-of-Words Embedding
 ###################
 VOCABULARY = ["the", "cat", "dog", "apple", "banana", "run", "walk", "blue", "sky", 
               "apples", "bananas", "sat", "mat", "jumped", "over", "delicious"]
 
+_VECTORIZER = Vectorizer(VOCABULARY)
+
 def text_to_bow(text):
-    tokens = text.lower().split()
-    bow_vector = [0] * len(VOCABULARY)
-    for word in tokens:
-        if word in VOCABULARY:
-            idx = VOCABULARY.index(word)
-            bow_vector[idx] += 1
-    return bow_vector
+    # Hash-map vocabulary lookup and punctuation handling from tokenizer.py
+    return _VECTORIZER.transform(text)
 
 ###################
 # 2) Euclidean Distance
@@ -61,6 +64,58 @@ def chunk_text(document, max_sentence_length=80):
             chunks.append(sentence)
     return chunks
 
+def iter_chunk_file(path, max_sentence_length=80, buffer_size=1 << 16):
+    """
+    Stream the chunks chunk_text would produce for the file at path.
+    The file is read buffer_size bytes at a time and a sentence cut off at a
+    buffer boundary is carried over, keeping at most max_sentence_length
+    characters of it. Yields (chunk, byte offset of the chunk in the file).
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    byte_pos = 0     # file offset of the next character to look at
+    head = ""        # first max_sentence_length chars of the sentence, left-stripped
+    head_offset = 0
+    more = False     # does the sentence have non-space text beyond head?
+
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(buffer_size)
+            text = decoder.decode(data, final=not data)
+            pos = 0
+            while True:
+                dot = text.find('.', pos)
+                segment = text[pos:] if dot == -1 else text[pos:dot]
+
+                if not head:
+                    stripped = segment.lstrip()
+                    if stripped:
+                        skipped = segment[:len(segment) - len(stripped)]
+                        head_offset = byte_pos + len(skipped.encode('utf-8'))
+                        head = stripped[:max_sentence_length]
+                        more = bool(stripped[max_sentence_length:].strip())
+                elif len(head) < max_sentence_length:
+                    need = max_sentence_length - len(head)
+                    head += segment[:need]
+                    more = more or bool(segment[need:].strip())
+                elif not more:
+                    more = bool(segment.strip())
+                byte_pos += len(segment.encode('utf-8'))
+
+                if dot == -1:
+                    break
+                if head:
+                    # Same as sentence.strip()[:max_sentence_length]
+                    yield (head if more else head.rstrip()), head_offset
+                head, more = "", False
+                byte_pos += 1  # the '.'
+                pos = dot + 1
+
+            if not data:
+                break
+
+    if head:
+        yield (head if more else head.rstrip()), head_offset
+
 ###################
 # 5) Complete Workflow
 ###################
@@ -73,11 +128,20 @@ if __name__ == "__main__":
         "I love to walk under the blue sky."
     )
     
-    # 1) Chunk the text
-    chunks = chunk_text(document)
+    # --matrix stores embeddings in vectordb.MatrixVectorDB (contiguous
+    # float32 storage for large corpora) instead of SimpleVectorDB
+    args = sys.argv[1:]
+    use_matrix = "--matrix" in args
+    args = [arg for arg in args if arg != "--matrix"]
+
+    # 1) Chunk the text (or stream it from a file given on the command line)
+    if args:
+        chunks = (chunk for chunk, _ in iter_chunk_file(args[0]))
+    else:
+        chunks = chunk_text(document)
     
     # 2) Create a vector DB and insert chunks
-    db = SimpleVectorDB()
+    db = MatrixVectorDB() if use_matrix else SimpleVectorDB()
     for chunk in chunks:
         emb = text_to_bow(chunk)
         db.add(chunk, emb)
@@ -96,13 +160,13 @@ if __name__ == "__main__":
     # 5) Display the retrieved chunk(s) and form a naive answer
     print("Query:", query)
     print("emb: ", query_embedding)    
-    for i, (res_text, dist, emb) in enumerate(results):
+    for i, (res_text, dist, *_) in enumerate(results):
         print(f"Retrieved chunk #{i+1} (Distance={dist:.2f}): {res_text}")
     
     # (Optional) Construct an answer from retrieved chunk(s)
     # A real RAG system would feed the chunk + query to an LLM for generation.
     # For demonstration, we just print the chunk as "the answer."
-    best_chunk, _, _ = results[0]
+    best_chunk = results[0][0]
     answer = f"The text says: '{best_chunk}'."
     print("Answer:", answer)
 
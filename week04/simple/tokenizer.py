@@ -0,0 +1,87 @@
+import re
+
+import numpy as np
+
+# Anything that is not a letter, digit or whitespace becomes a word break,
+# the same cleaning create_bow_embedding in week04/docrag does.
+NON_WORD_RE = re.compile(r'[^a-zA-Z0-9\s]')
+
+
+def tokenize(text):
+    """
+    Lowercase text, turn punctuation into spaces and split it into words.
+    text: string
+    returns: list of strings
+    """
+    return NON_WORD_RE.sub(' ', text.lower()).split()
+
+
+class Vectorizer:
+    def __init__(self, vocabulary):
+        """
+        Compile a vocabulary list into a word -> index hash map once, so
+        each token lookup is O(1) instead of a scan of the list.
+        vocabulary: list of words; a word's position is its index
+        """
+        self.vocabulary = list(vocabulary)
+        self.word_index = {word: idx for idx, word in enumerate(self.vocabulary)}
+
+    def token_ids(self, text):
+        """
+        returns: list of vocabulary indices of the words in text (unknown words dropped)
+        """
+        word_index = self.word_index
+        return [word_index[w] for w in tokenize(text) if w in word_index]
+
+    def transform(self, text):
+        """
+        Convert text to a Bag-of-Words vector.
+        returns: list of integers, length == len(vocabulary)
+        """
+        bow_vector = [0] * len(self.vocabulary)
+        for idx in self.token_ids(text):
+            bow_vector[idx] += 1
+        return bow_vector
+
+    def transform_sparse(self, text):
+        """
+        returns: dict mapping vocabulary index -> count (missing indices are 0)
+        """
+        sparse_vector = {}
+        for idx in self.token_ids(text):
+            sparse_vector[idx] = sparse_vector.get(idx, 0) + 1
+        return sparse_vector
+
+    def transform_batch(self, texts):
+        """
+        Vectorize many texts in one call.
+        texts: list of strings
+        returns: numpy array of shape (len(texts), len(vocabulary)) with word counts
+        """
+        dim = len(self.vocabulary)
+        rows = []
+        cols = []
+        for row, text in enumerate(texts):
+            ids = self.token_ids(text)
+            rows.extend([row] * len(ids))
+            cols.extend(ids)
+
+        # One bincount over flattened (row, column) positions fills the whole matrix
+        flat = np.asarray(rows, dtype=np.int64) * dim + np.asarray(cols, dtype=np.int64)
+        counts = np.bincount(flat, minlength=len(texts) * dim)
+        return counts.reshape(len(texts), dim)
+
+
+# Example usage:
+if __name__ == "__main__":
+    vectorizer = Vectorizer(["the", "cat", "dog", "apple", "banana", "run", "walk", "blue", "sky"])
+
+    texts = [
+        "The cat and the dog run under a blue sky.",
+        "The dog apple banana.",
+        "The cat, dog, and blue banana.",
+    ]
+    print("Tokens:   ", tokenize(texts[2]))
+    print("Embedding:", vectorizer.transform(texts[2]))
+    print("Batch:")
+    print(vectorizer.transform_batch(texts))
@@ -1,25 +1,22 @@
+import numpy as np
+
+from tokenizer import Vectorizer
+
 VOCABULARY = ["the", "cat", "dog", "apple", "banana", "run", "walk", "blue", "sky"]
 
 
+_VECTORIZER = Vectorizer(VOCABULARY)
+
+
 def text_to_bow(text):
     """
-    Convert text to a simple Bag-of-Words vector based on the glo
-bal VOCABULARY.
+    Convert text to a simple Bag-of-Words vector based on the global VOCABULARY.
     text: string
     returns: list of integers, length == len(VOCABULARY)
     """
-    # Convert text to lowercase and split by whitespace for simplicity
-    tokens = text.lower().split()
-
-    # Initialize vector with zeros, one for each vocabulary word
-    bow_vector = [0] * len(VOCABULARY)
-
-    for word in tokens:
-        if word in VOCABULARY:
-            idx = VOCABULARY.index(word)
-            bow_vector[idx] += 1
-
-    return bow_vector
+    # Lowercase, strip punctuation and count words with a precompiled
+    # word -> index map (see tokenizer.py)
+    return _VECTORIZER.transform(text)
 
 def euclidean_distance(vec1, vec2):
     """
@@ -67,6 +64,97 @@ class SimpleVectorDB:
         return results[:k]
 
 
+class MatrixVectorDB:
+    def __init__(self, dim=None, initial_capacity=16):
+        # Embeddings live in one contiguous float32 matrix. Only the first
+        # self.size rows are in use; the rest is spare capacity that is
+        # doubled whenever it runs out, so add() is amortized O(dim).
+        self.texts = []
+        self.size = 0
+        self.capacity = initial_capacity
+        self.matrix = None
+        self.sq_norms = None
+        if dim is not None:
+            self._allocate(dim)
+
+    def _allocate(self, dim):
+        self.matrix = np.zeros((self.capacity, dim), dtype=np.float32)
+        self.sq_norms = np.zeros(self.capacity, dtype=np.float32)
+
+    def _grow(self):
+        """
+        Double the capacity of the embedding matrix, copying the rows in use.
+        """
+        self.capacity *= 2
+        matrix = np.zeros((self.capacity, self.matrix.shape[1]), dtype=np.float32)
+        matrix[:self.size] = self.matrix[:self.size]
+        sq_norms = np.zeros(self.capacity, dtype=np.float32)
+        sq_norms[:self.size] = self.sq_norms[:self.size]
+        self.matrix = matrix
+        self.sq_norms = sq_norms
+
+    def add(self, text, embedding):
+        """
+        Add a new text and its embedding to the database.
+        """
+        row = np.asarray(embedding, dtype=np.float32)
+        if self.matrix is None:
+            self._allocate(len(row))
+        if len(row) != self.matrix.shape[1]:
+            raise ValueError("Vectors must be the same length.")
+        if self.size == self.capacity:
+            self._grow()
+
+        self.matrix[self.size] = row
+        self.sq_norms[self.size] = row @ row
+        self.texts.append(text)
+        self.size += 1
+
+    def search(self, query_embedding, k=1):
+        """
+        Find the top k nearest texts (smallest Euclidean distance) to the query_embedding.
+        query_embedding: one embedding, or a list of embeddings to search as a batch
+        Returns a list of (text, distance) sorted by distance ascending, or one
+        such list per query when a batch is given.
+        """
+        queries = np.asarray(query_embedding, dtype=np.float32)
+        single = queries.ndim == 1
+        if single:
+            queries = queries[np.newaxis, :]
+
+        if self.size == 0:
+            return [] if single else [[] for _ in queries]
+        if queries.shape[1] != self.matrix.shape[1]:
+            raise ValueError("Vectors must be the same length.")
+
+        # |x - q|^2 = |x|^2 - 2 x.q + |q|^2 for every (query, row) pair at once
+        matrix = self.matrix[:self.size]
+        dists = (
+            self.sq_norms[:self.size][np.newaxis, :]
+            - 2.0 * (queries @ matrix.T)
+            + np.einsum("ij,ij->i", queries, queries)[:, np.newaxis]
+        )
+        np.maximum(dists, 0.0, out=dists)
+        np.sqrt(dists, out=dists)
+
+        # Select the k smallest per query without sorting every row
+        k = min(k, self.size)
+        if k < self.size:
+            top = np.argpartition(dists, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(self.size), (len(queries), self.size))
+        top_dists = np.take_along_axis(dists, top, axis=1)
+        order = np.argsort(top_dists, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_dists = np.take_along_axis(top_dists, order, axis=1)
+
+        results = [
+            [(self.texts[i], float(d)) for i, d in zip(row_idx, row_dists)]
+            for row_idx, row_dists in zip(top, top_dists)
+        ]
+        return results[0] if single else results
+
+
 # Example usage:
 if __name__ == "__main__":
     # Initialize
@@ -91,3 +179,11 @@ if __name__ == "__main__":
 
     nearest = db.search(text3_embedding, k=1)
     print("Nearest chunk:", nearest)
+
+    # Same data in a contiguous float32 matrix, queried as a batch
+    mdb = MatrixVectorDB()
+    mdb.add(text1, text_to_bow(text1))
+    mdb.add(text2, text_to_bow(text2))
+
+    nearest = mdb.search([text3_embedding, text_to_bow(text1)], k=1)
+    print("Nearest chunks (batch):", nearest)
@@ -4,6 +4,7 @@ import argparse
 from pathlib import Path
 import requests
 import json
+import importlib.util
 from typing import List, Optional
 
 from rich import print
@@ -34,27 +35,63 @@ except ImportError:
     print("python-dotenv not available. To use .env files, install with:")
     print("pip install python-dotenv")
 
+# Try to load the persistent embedding cache from week06/llama-index
+try:
+    _cache_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "..", "week06", "llama-index", "embedding_cache.py")
+    _spec = importlib.util.spec_from_file_location("embedding_cache", _cache_path)
+    embedding_cache = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(embedding_cache)
+    EmbeddingCache = embedding_cache.EmbeddingCache
+except Exception as e:
+    print(f"Embedding cache not available ({e}); Ollama embeddings will not be cached.")
+    EmbeddingCache = None
+
+DEFAULT_OLLAMA_URL = "http://localhost:11434"
+
 # Create a custom embedding class for Ollama
 class OllamaEmbedding(BaseEmbedding):
     """Ollama embedding model.
     
-    Uses Ollama's API to generate embeddings.
+    Uses Ollama's API to generate embeddings, consulting the persistent
+    embedding cache first when it is available.
     """
     model_name: str = Field(default="nomic-embed-text", description="Name of the Ollama embedding model")
-    _base_url: str = PrivateAttr(default="http://localhost:11434")
+    _base_url: str = PrivateAttr(default=DEFAULT_OLLAMA_URL)
+    _cache: Optional[object] = PrivateAttr(default=None)
     
     def __init__(
         self,
         model_name: str = "nomic-embed-text",
-        base_url: str = "http://localhost:11434",
+        base_url: str = DEFAULT_OLLAMA_URL,
         embed_batch_size: int = 10,
         **kwargs
     ):
         """Initialize Ollama embedding model."""
         super().__init__(embed_batch_size=embed_batch_size, **kwargs)
         self._base_url = base_url.rstrip("/")
+        self._cache = EmbeddingCache() if EmbeddingCache is not None else None
         
+    def _cache_model(self) -> str:
+        """Model name under which embeddings from this server are cached."""
+        server = "ollama" if self._base_url == DEFAULT_OLLAMA_URL else self._base_url
+        return f"{server}/{self.model_name}"
+    
     def _get_embedding(self, text: str) -> List[float]:
+        """Get embedding for a single text, from the cache or the Ollama API."""
+        cache_model = self._cache_model()
+        if self._cache is not None:
+            cached = self._cache.get(cache_model, text)
+            if cached is not None:
+                return cached
+        
+        embedding = self._request_embedding(text)
+        # Failed requests return a zero vector, which must not be cached
+        if self._cache is not None and any(embedding):
+            self._cache.put(cache_model, text, embedding)
+        return embedding
+    
+    def _request_embedding(self, text: str) -> List[float]:
         """Get embedding for a single text using Ollama API."""
         url = f"{self._base_url}/api/embed"
         payload = {
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Streaming storage for code chunks.
+
+Chunk files are JSON Lines: one chunk object per line, written as chunks are
+produced and read back one at a time, so neither side needs the whole chunk
+set in memory. Older chunk files that hold a single (indented) JSON array are
+still read; the format is detected from the first character of the file.
+Chunk IDs come from make_chunk_id, which needs nothing beyond the standard
+library, so chunk files can be indexed without the chunking dependencies.
+
+Usage:
+    with ChunkWriter("xv6-riscv.jsonl") as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+    for chunk in iter_chunks("xv6-riscv.jsonl"):
+        ...
+
+    python chunk_store.py <chunk-file> [<output.jsonl>]    # count, or convert to JSONL
+"""
+
+import os
+import sys
+import json
+import hashlib
+
+def make_chunk_id(relpath, start_line, end_line, content):
+    """Content-addressed chunk ID: a hash of the chunk's file, line span and text.
+    
+    The ID only changes when the chunk itself changes, so it stays stable
+    when other files are edited, added or removed.
+    """
+    digest = hashlib.sha1()
+    digest.update(f"{relpath}\0{start_line}\0{end_line}\0".encode("utf-8"))
+    digest.update(content.encode("utf-8"))
+    return digest.hexdigest()
+
+def _is_json_array(f):
+    """True if a text file holds a JSON array; leaves the file at its start."""
+    while True:
+        c = f.read(1)
+        if not c or not c.isspace():
+            f.seek(0)
+            return c == "["
+
+def iter_chunks(chunk_file):
+    """Yield the chunks of a JSONL or legacy JSON-array chunk file one by one."""
+    with open(chunk_file, 'r', encoding='utf-8') as f:
+        if _is_json_array(f):
+            # Legacy format: the array has to be parsed in one piece
+            yield from json.load(f)
+            return
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{chunk_file}:{line_number}: {e}") from None
+
+def load_chunks(chunk_file):
+    """Read all chunks of a chunk file into a list."""
+    return list(iter_chunks(chunk_file))
+
+def read_chunk_span(f, start, end):
+    """Read the chunks stored in bytes [start, end) of a JSONL chunk file
+    opened in binary mode, as recorded by ChunkWriter.position."""
+    f.seek(start)
+    data = f.read(end - start)
+    # Split on b"\n" only: str.splitlines would also split on U+2028 inside strings
+    return [json.loads(line) for line in data.split(b"\n") if line.strip()]
+
+class ChunkWriter:
+    """Append chunks to a JSONL chunk file as they are produced.
+
+    The chunks are written to a temporary file that replaces chunk_file when
+    the writer is closed without an error, so the previous version stays
+    readable (and intact, if chunking fails) while the new one is written.
+    """
+
+    def __init__(self, chunk_file):
+        self.chunk_file = chunk_file
+        self.temp_file = f"{chunk_file}.tmp"
+        self.count = 0
+        # Binary mode, so position is a plain byte offset on every platform
+        self._f = open(self.temp_file, 'wb')
+
+    @property
+    def position(self):
+        """Byte offset at which the next chunk will be written."""
+        return self._f.tell()
+
+    def write(self, chunk):
+        self._f.write(json.dumps(chunk, ensure_ascii=False).encode('utf-8') + b"\n")
+        self.count += 1
+
+    def write_many(self, chunks):
+        for chunk in chunks:
+            self.write(chunk)
+
+    def close(self):
+        """Finish the file and move it into place."""
+        if not self._f.closed:
+            self._f.close()
+            os.replace(self.temp_file, self.chunk_file)
+
+    def abort(self):
+        """Discard the partly written file, keeping any previous chunk_file."""
+        if not self._f.closed:
+            self._f.close()
+            os.remove(self.temp_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print(f"Usage: {sys.argv[0]} <chunk-file> [<output.jsonl>]")
+        sys.exit(1)
+
+    if len(sys.argv) == 2:
+        count = sum(1 for _ in iter_chunks(sys.argv[1]))
+        print(f"{sys.argv[1]}: {count} chunks")
+        return
+
+    with ChunkWriter(sys.argv[2]) as writer:
+        writer.write_many(iter_chunks(sys.argv[1]))
+    print(f"Wrote {writer.count} chunks to {sys.argv[2]}")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
 """
-Code Chunker - Chunks C/C++ source files and saves metadata to a JSON file.
+Code Chunker - Chunks C/C++ source files and saves metadata to a JSONL file.
 
 This script takes a directory path as a command line argument, finds all .c and .h
-files in that directory, chunks them using the CodeSplitter class, and saves the
-results to a JSON file.
+files in that directory, chunks them through a ChunkingSession, and writes the
+chunks to a JSON Lines file (see chunk_store.py) as each file is processed.
 
 Usage:
     python code-chunker.py <path_to_source_directory>
@@ -15,10 +15,9 @@ Example:
 
 import os
 import sys
-import json
 from pathlib import Path
 
-# Import the CodeSplitter
+# Import ChunkingSession
 try:
     # Using importlib to handle the hyphen in the filename
     import importlib.util
@@ -28,9 +27,12 @@ try:
     spec = importlib.util.spec_from_file_location("code_meta", code_meta_path)
     code_meta = importlib.util.module_from_spec(spec)
     spec.loader.exec_module(code_meta)
-    CodeSplitter = code_meta.CodeSplitter
+    ChunkingSession = code_meta.ChunkingSession
     
-    from llama_index.core.schema import Document
+    spec = importlib.util.spec_from_file_location("chunk_store", os.path.join(script_dir, "chunk_store.py"))
+    chunk_store = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(chunk_store)
+    ChunkWriter = chunk_store.ChunkWriter
 except ImportError as e:
     print(f"Error: {e}")
     print("Please ensure you have the required packages installed:")
@@ -46,49 +48,23 @@ def find_source_files(directory):
                 source_files.append(os.path.join(root, file))
     return source_files
 
-def process_file(file_path, base_dir):
-    """Process a source file and return its chunks with metadata."""
-    try:
-        # Read the file content
-        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-            code = f.read()
-        
-        # Create a Document from the code with file path information
-        document = Document(
-            text=code,
-            metadata={
-                "filepath": file_path,
-                "base_dir": base_dir
-            }
-        )
-        
-        # Configure the CodeSplitter
-        code_splitter = CodeSplitter(
-            language="c",
-            chunk_lines=60,  # Adjust as needed
-            chunk_lines_overlap=5,  # Adjust as needed
-            max_chars=2048,  # Adjust as needed
-        )
-        
-        # Split the document into nodes with enhanced metadata
-        nodes = code_splitter.get_nodes_from_documents([document])
-        
-        # Convert nodes to the required format
-        chunks = []
-        for node in nodes:
-            chunk = {
-                "filepath": node.metadata.get("filepath", ""),
-                "filename": node.metadata.get("filename", ""),
-                "relpath": node.metadata.get("relpath", ""),
-                "start_line": node.metadata.get("start_line", 0),
-                "end_line": node.metadata.get("end_line", 0),
-                "length": node.metadata.get("end_line", 0) - node.metadata.get("start_line", 0) + 1,
-                "content": node.text
-            }
-            chunks.append(chunk)
-        
-        return chunks
+def new_chunking_session():
+    """Create a ChunkingSession with the chunking parameters used by this script."""
+    return ChunkingSession(
+        chunk_lines=60,  # Adjust as needed
+        chunk_lines_overlap=5,  # Adjust as needed
+        max_chars=2048,  # Adjust as needed
+    )
+
+def process_file(file_path, base_dir, session=None):
+    """Process a source file and return its chunks with metadata.
     
+    Pass the same session for every file so its CodeSplitter and tree-sitter
+    parser are reused.
+    """
+    session = session or new_chunking_session()
+    try:
+        return session.chunk_file(file_path, base_dir, "c")
     except Exception as e:
         print(f"Error processing file {file_path}: {e}")
         import traceback
@@ -117,24 +93,24 @@ def main():
     source_files = find_source_files(abs_dir_path)
     print(f"Found {len(source_files)} source files in {abs_dir_path}")
     
-    # Process each file and collect chunks
-    all_chunks = []
-    for file_path in source_files:
-        print(f"Processing {file_path}")
-        chunks = process_file(file_path, abs_dir_path)
-        all_chunks.extend(chunks)
-        print(f"  - Generated {len(chunks)} chunks")
-    
     # Create the output file path
-    output_file = f"{base_dir_name}-chunks.json"
+    output_file = f"{base_dir_name}-chunks.jsonl"
     
-    # Save the chunks to a JSON file
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(all_chunks, f, indent=2)
+    # Process each file, reusing one parser throughout, and append its chunks
+    # to the output file
+    session = new_chunking_session()
+    with ChunkWriter(output_file) as writer:
+        for file_path in source_files:
+            print(f"Processing {file_path}")
+            chunks = process_file(file_path, abs_dir_path, session)
+            with session.timed("serialize"):
+                writer.write_many(chunks)
+            print(f"  - Generated {len(chunks)} chunks")
     
     print(f"\nSuccessfully processed {len(source_files)} files.")
-    print(f"Generated {len(all_chunks)} chunks.")
+    print(f"Generated {writer.count} chunks.")
     print(f"Results saved to {output_file}")
+    print(session.report())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
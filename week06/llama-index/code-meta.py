@@ -1,7 +1,12 @@
 """Code splitter with enhanced metadata for file paths and line numbers."""
 
+import importlib.util
 import os
-from typing import Any, Callable, Dict, List, Optional, Tuple
+import time
+from bisect import bisect_right
+from contextlib import contextmanager
+from itertools import accumulate
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 from llama_index.core.bridge.pydantic import Field, PrivateAttr
 from llama_index.core.callbacks.base import CallbackManager
@@ -15,6 +20,150 @@ DEFAULT_LINES_OVERLAP = 15
 DEFAULT_MAX_CHARS = 1500
 
 
+# Chunk IDs are defined next to the chunk file format, which has no dependencies
+_spec = importlib.util.spec_from_file_location(
+    "chunk_store", os.path.join(os.path.dirname(os.path.abspath(__file__)), "chunk_store.py")
+)
+_chunk_store = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_chunk_store)
+make_chunk_id = _chunk_store.make_chunk_id
+
+
+# C node types whose definitions are recorded as symbols, and their kinds
+C_TYPE_SPECIFIERS = {"struct_specifier": "struct", "union_specifier": "union", "enum_specifier": "enum"}
+# Nodes that cannot contain top-level definitions are not searched
+SYMBOL_SKIP_TYPES = {
+    "compound_statement", "field_declaration_list", "enumerator_list",
+    "initializer_list", "parameter_list", "comment", "string_literal",
+}
+
+
+def _declarator_name(node: Any) -> Any:
+    """Return the identifier node declared by a C declarator, through pointer,
+    array, function and parenthesized declarators."""
+    while node is not None:
+        if node.type in ("identifier", "type_identifier", "field_identifier"):
+            return node
+        inner = node.child_by_field_name("declarator")
+        if inner is None and node.type == "parenthesized_declarator" and node.named_children:
+            inner = node.named_children[0]
+        node = inner
+    return None
+
+
+# Tree-sitter queries capturing the name of each called function: C calls of
+# plain identifiers (not function pointer fields), Python calls of names and methods
+CALL_QUERIES = {
+    "c": "(call_expression function: (identifier) @name)",
+    "python": "(call function: [(identifier) @name (attribute attribute: (identifier) @name)])",
+}
+_call_queries: Dict[str, Any] = {}
+
+
+def _call_query(language: str) -> Any:
+    """Return the compiled call query for language (None if there is none)."""
+    if language not in _call_queries:
+        import tree_sitter_languages  # pants: no-infer-dep
+
+        query_string = CALL_QUERIES.get(language)
+        _call_queries[language] = (
+            tree_sitter_languages.get_language(language).query(query_string)
+            if query_string else None
+        )
+    return _call_queries[language]
+
+
+def extract_symbols(tree: Any, source: bytes, language: str = "c") -> List[Dict[str, Any]]:
+    """Find the symbols defined in a parsed file.
+
+    For C these are function definitions, struct/union/enum definitions with a
+    body, typedef names and macros; for Python, functions and classes. Each
+    symbol is a dict with name, kind and 1-based start_line and end_line, in
+    source order. Functions also list the names they call in "calls", the
+    edges of the call graph.
+    """
+    symbols = []
+    # (start byte, end byte, symbol) of each function, in source order
+    functions = []
+
+    def add(name_node: Any, kind: str, node: Any) -> None:
+        if name_node is not None:
+            end_row, end_column = node.end_point
+            # Macro definitions end after their newline, at column 0 of the next line
+            if end_column == 0 and end_row > node.start_point[0]:
+                end_row -= 1
+            symbols.append({
+                "name": source[name_node.start_byte:name_node.end_byte].decode("utf-8", "replace"),
+                "kind": kind,
+                "start_line": node.start_point[0] + 1,
+                "end_line": end_row + 1,
+            })
+            if kind == "function":
+                symbols[-1]["calls"] = []
+                functions.append((node.start_byte, node.end_byte, symbols[-1]))
+
+    stack = [tree.root_node]
+    while stack:
+        node = stack.pop()
+        kind = node.type
+        if language == "python":
+            if kind in ("function_definition", "class_definition"):
+                add(node.child_by_field_name("name"), kind.split("_")[0], node)
+                if kind == "function_definition":
+                    continue
+        elif kind == "function_definition":
+            add(_declarator_name(node.child_by_field_name("declarator")), "function", node)
+            continue
+        elif kind in ("preproc_def", "preproc_function_def"):
+            add(node.child_by_field_name("name"), "macro", node)
+            continue
+        elif kind == "type_definition":
+            add(_declarator_name(node.child_by_field_name("declarator")), "typedef", node)
+        elif kind in C_TYPE_SPECIFIERS:
+            if node.child_by_field_name("body") is not None:
+                add(node.child_by_field_name("name"), C_TYPE_SPECIFIERS[kind], node)
+            continue
+        elif kind in SYMBOL_SKIP_TYPES:
+            continue
+        # Children are pushed in reverse so symbols come out in source order
+        stack.extend(reversed(node.children))
+
+    # Match every call in the file in one query (run in C) and assign each
+    # callee to the function whose span contains the call
+    query = _call_query(language) if functions else None
+    if query is not None:
+        starts = [start for start, _, _ in functions]
+        seen: Dict[int, set] = {}
+        for node, _ in query.captures(tree.root_node):
+            i = bisect_right(starts, node.start_byte) - 1
+            if i < 0 or node.start_byte >= functions[i][1]:
+                continue
+            name = source[node.start_byte:node.end_byte].decode("utf-8", "replace")
+            called = seen.setdefault(i, set())
+            if name not in called:
+                called.add(name)
+                functions[i][2]["calls"].append(name)
+    return symbols
+
+
+def attach_symbols(chunks: List[Dict[str, Any]], symbols: List[Dict[str, Any]]) -> None:
+    """Store each symbol in the "symbols" list of the chunk where its definition
+    starts, with the IDs of all chunks the definition spans as "chunk_ids"."""
+    starts = [chunk["start_line"] for chunk in chunks]
+    for chunk in chunks:
+        chunk["symbols"] = []
+    if not chunks:
+        return
+    for symbol in symbols:
+        first = max(bisect_right(starts, symbol["start_line"]) - 1, 0)
+        last = first
+        # A chunk starting on the definition's last line only holds its tail
+        while last + 1 < len(chunks) and starts[last + 1] < symbol["end_line"]:
+            last += 1
+        symbol["chunk_ids"] = [chunk["id"] for chunk in chunks[first:last + 1]]
+        chunks[first]["symbols"].append(symbol)
+
+
 class CodeSplitter(TextSplitter):
     """Split code using a AST parser with enhanced metadata for file paths and line numbers.
 
@@ -153,27 +302,26 @@ class CodeSplitter(TextSplitter):
             # Handle paths on different drives in Windows
             return filepath
 
-    def _calculate_line_offsets(self, text: str) -> List[int]:
-        """Calculate byte offsets for the start of each line."""
-        offsets = [0]  # First line starts at offset 0
-        for i, char in enumerate(text):
-            if char == '\n':
-                offsets.append(i + 1)  # Next line starts after newline
-        return offsets
+    def _calculate_line_offsets(self, text: Union[str, bytes]) -> List[int]:
+        """Calculate byte offsets for the start of each line.
+
+        Offsets are computed on the UTF-8 encoding, since tree-sitter reports
+        byte positions; for non-ASCII sources these differ from str indices.
+        """
+        source = text.encode("utf-8") if isinstance(text, str) else text
+        # bytes.split finds the newlines in C; each line starts one byte
+        # after the previous line's newline
+        lines = source.split(b"\n")
+        return list(accumulate((len(line) + 1 for line in lines[:-1]), initial=0))
 
     def _byte_to_line(self, byte_offset: int, line_offsets: List[int]) -> int:
-        """Convert byte offset to line number (0-based)."""
-        for i, offset in enumerate(line_offsets):
-            if i + 1 < len(line_offsets) and byte_offset < line_offsets[i + 1]:
-                return i
-            if i + 1 == len(line_offsets):
-                return i
-        return len(line_offsets) - 1
+        """Convert byte offset to line number (0-based) by binary search."""
+        return max(bisect_right(line_offsets, byte_offset) - 1, 0)
 
     def _chunk_node(
         self, 
         node: Any, 
-        text: str, 
+        source: Union[str, bytes, memoryview], 
         line_offsets: Optional[List[int]] = None,
         last_end: int = 0,
         metadata: Optional[Dict[str, Any]] = None
@@ -181,9 +329,13 @@ class CodeSplitter(TextSplitter):
         """
         Enhanced chunking method that tracks line numbers and maintains metadata.
         
+        Chunks are tracked as (start_byte, end_byte) spans over the UTF-8 source,
+        the same coordinates tree-sitter uses, and each chunk is decoded exactly
+        once when it is emitted.
+        
         Args:
             node: The tree-sitter node to chunk
-            text: The original source code text
+            source: The original source code (UTF-8 bytes; str is encoded)
             line_offsets: List of byte offsets for each line
             last_end: Last ending byte position
             metadata: Metadata to include with chunks
@@ -192,97 +344,76 @@ class CodeSplitter(TextSplitter):
             List of tuples (chunk_text, chunk_metadata)
         """
         metadata = metadata or {}
-        line_offsets = line_offsets or self._calculate_line_offsets(text)
+        if isinstance(source, str):
+            source = source.encode("utf-8")
+        view = source if isinstance(source, memoryview) else memoryview(source)
+        line_offsets = line_offsets or self._calculate_line_offsets(bytes(view))
         
         new_chunks = []
-        current_chunk = ""
-        current_chunk_start = last_end
+        
+        def emit(start: int, end: int) -> None:
+            chunk_metadata = {
+                **metadata,
+                "start_line": self._byte_to_line(start, line_offsets) + 1,  # 1-based line numbering
+                "end_line": self._byte_to_line(end, line_offsets) + 1
+            }
+            new_chunks.append((str(view[start:end], "utf-8", "replace"), chunk_metadata))
+        
+        # The current chunk is the span [chunk_start, last_end)
+        chunk_start = last_end
         
         for child in node.children:
-            if child.end_byte - child.start_byte > self.max_chars:
+            child_size = child.end_byte - child.start_byte
+            if child_size > self.max_chars:
                 # Child is too big, recursively chunk the child
-                if len(current_chunk) > 0:
-                    # Create metadata for the current chunk
-                    chunk_start_line = self._byte_to_line(current_chunk_start, line_offsets)
-                    chunk_end_line = self._byte_to_line(last_end, line_offsets)
-                    
-                    chunk_metadata = {
-                        **metadata,
-                        "start_line": chunk_start_line + 1,  # Convert to 1-based line numbering
-                        "end_line": chunk_end_line + 1
-                    }
-                    
-                    new_chunks.append((current_chunk, chunk_metadata))
-                    
-                current_chunk = ""
-                current_chunk_start = last_end
+                if last_end > chunk_start:
+                    emit(chunk_start, last_end)
                 
                 # Recursively chunk the child with the same metadata base
-                child_chunks = self._chunk_node(
-                    child, 
-                    text, 
-                    line_offsets,
-                    last_end,
-                    metadata
+                new_chunks.extend(
+                    self._chunk_node(child, view, line_offsets, last_end, metadata)
                 )
-                new_chunks.extend(child_chunks)
+                chunk_start = child.end_byte
                 
-            elif (
-                len(current_chunk) + child.end_byte - child.start_byte > self.max_chars
-            ):
+            elif (last_end - chunk_start) + child_size > self.max_chars:
                 # Child would make the current chunk too big, so start a new chunk
-                if len(current_chunk) > 0:
-                    # Create metadata for the current chunk
-                    chunk_start_line = self._byte_to_line(current_chunk_start, line_offsets)
-                    chunk_end_line = self._byte_to_line(last_end, line_offsets)
-                    
-                    chunk_metadata = {
-                        **metadata,
-                        "start_line": chunk_start_line + 1,
-                        "end_line": chunk_end_line + 1
-                    }
-                    
-                    new_chunks.append((current_chunk, chunk_metadata))
-                
-                current_chunk = text[last_end : child.end_byte]
-                current_chunk_start = last_end
-                
-            else:
-                current_chunk += text[last_end : child.end_byte]
+                if last_end > chunk_start:
+                    emit(chunk_start, last_end)
+                chunk_start = last_end
             
             last_end = child.end_byte
         
         # Handle any remaining chunk
-        if len(current_chunk) > 0:
-            chunk_start_line = self._byte_to_line(current_chunk_start, line_offsets)
-            chunk_end_line = self._byte_to_line(last_end, line_offsets)
-            
-            chunk_metadata = {
-                **metadata,
-                "start_line": chunk_start_line + 1,
-                "end_line": chunk_end_line + 1
-            }
-            
-            new_chunks.append((current_chunk, chunk_metadata))
+        if last_end > chunk_start:
+            emit(chunk_start, last_end)
         
         return new_chunks
 
-    def _process_text_with_metadata(
-        self, 
-        text: str, 
+    def _parse_source(self, source: bytes) -> Any:
+        """Parse UTF-8 source code and return the tree-sitter tree."""
+        tree = self._parser.parse(source)
+        if (
+            tree.root_node.children
+            and tree.root_node.children[0].type == "ERROR"
+        ):
+            raise ValueError(f"Could not parse code with language {self.language}.")
+        return tree
+
+    def _chunks_from_tree(
+        self,
+        tree: Any,
+        source: bytes,
+        line_offsets: List[int],
         filepath: Optional[str] = None,
         base_dir: Optional[str] = None
     ) -> List[Tuple[str, Dict[str, Any]]]:
-        """Process text and generate chunks with metadata."""
+        """Generate chunks with metadata from an already parsed tree."""
         # Calculate file path information
         filepath = filepath or self.filepath
         base_dir = base_dir or self.base_dir
         filename = self._extract_filename(filepath)
         relpath = self._calculate_relpath(filepath, base_dir)
         
-        # Calculate line offsets
-        line_offsets = self._calculate_line_offsets(text)
-        
         # Base metadata for all chunks
         base_metadata = {
             "filename": filename,
@@ -290,31 +421,36 @@ class CodeSplitter(TextSplitter):
             "relpath": relpath
         }
         
+        # Process chunks with metadata
+        chunks_with_metadata = self._chunk_node(
+            tree.root_node, 
+            memoryview(source),
+            line_offsets,
+            0,
+            base_metadata
+        )
+        
+        # Strip whitespace from chunk text
+        return [
+            (chunk.strip(), metadata) 
+            for chunk, metadata in chunks_with_metadata
+        ]
+
+    def _process_text_with_metadata(
+        self, 
+        text: str, 
+        filepath: Optional[str] = None,
+        base_dir: Optional[str] = None
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """Process text and generate chunks with metadata."""
+        # Encode once; line offsets and tree-sitter both work in bytes
+        source = bytes(text, "utf-8")
+        line_offsets = self._calculate_line_offsets(source)
+        
         # Parse the code
-        tree = self._parser.parse(bytes(text, "utf-8"))
+        tree = self._parse_source(source)
         
-        if (
-            not tree.root_node.children
-            or tree.root_node.children[0].type != "ERROR"
-        ):
-            # Process chunks with metadata
-            chunks_with_metadata = self._chunk_node(
-                tree.root_node, 
-                text,
-                line_offsets,
-                0,
-                base_metadata
-            )
-            
-            # Strip whitespace from chunk text
-            chunks_with_metadata = [
-                (chunk.strip(), metadata) 
-                for chunk, metadata in chunks_with_metadata
-            ]
-            
-            return chunks_with_metadata
-        else:
-            raise ValueError(f"Could not parse code with language {self.language}.")
+        return self._chunks_from_tree(tree, source, line_offsets, filepath, base_dir)
 
     def split_text(self, text: str) -> List[str]:
         """Split incoming code and return chunks using the AST.
@@ -381,4 +517,130 @@ class CodeSplitter(TextSplitter):
                         metadata={}
                     )
         
-        return nodes
\ No newline at end of file
+        return nodes
+
+
+class ChunkingSession:
+    """Chunk many source files with one CodeSplitter (and parser) per language.
+
+    Constructing a CodeSplitter loads a tree-sitter parser and runs pydantic
+    validation, so a session creates one per language and reuses it for every
+    file. Each chunk lists the symbols whose definitions start in it (see
+    ``attach_symbols``). Wall time per phase (read, parse, chunk, symbols,
+    serialize) accumulates in ``timings``.
+    """
+
+    PHASES = ("read", "parse", "chunk", "symbols", "serialize")
+
+    def __init__(
+        self,
+        chunk_lines: int = DEFAULT_CHUNK_LINES,
+        chunk_lines_overlap: int = DEFAULT_LINES_OVERLAP,
+        max_chars: int = DEFAULT_MAX_CHARS,
+    ) -> None:
+        self.chunk_lines = chunk_lines
+        self.chunk_lines_overlap = chunk_lines_overlap
+        self.max_chars = max_chars
+        self._splitters: Dict[str, CodeSplitter] = {}
+        self.timings: Dict[str, float] = {phase: 0.0 for phase in self.PHASES}
+        self.files = 0
+        self.bytes = 0
+        self.chunks = 0
+
+    def splitter(self, language: str) -> CodeSplitter:
+        """Return the session's CodeSplitter for language, creating it on first use."""
+        splitter = self._splitters.get(language)
+        if splitter is None:
+            splitter = CodeSplitter(
+                language=language,
+                chunk_lines=self.chunk_lines,
+                chunk_lines_overlap=self.chunk_lines_overlap,
+                max_chars=self.max_chars,
+            )
+            self._splitters[language] = splitter
+        return splitter
+
+    @contextmanager
+    def timed(self, phase: str) -> Iterator[None]:
+        """Add the wall time of the with-block to the given phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] += time.perf_counter() - start
+
+    def chunk_file(
+        self, file_path: str, base_dir: Optional[str] = None, language: str = "c"
+    ) -> List[Dict[str, Any]]:
+        """Read, parse and chunk one file, returning chunk dictionaries."""
+        splitter = self.splitter(language)
+
+        with self.timed("read"):
+            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+                source = f.read().encode("utf-8")
+
+        with self.timed("parse"):
+            tree = splitter._parse_source(source)
+
+        with self.timed("chunk"):
+            line_offsets = splitter._calculate_line_offsets(source)
+            chunks_with_metadata = splitter._chunks_from_tree(
+                tree, source, line_offsets, file_path, base_dir
+            )
+
+        with self.timed("serialize"):
+            chunks = [
+                {
+                    "id": make_chunk_id(
+                        metadata.get("relpath", ""),
+                        metadata.get("start_line", 0),
+                        metadata.get("end_line", 0),
+                        text,
+                    ),
+                    "filepath": metadata.get("filepath", ""),
+                    "filename": metadata.get("filename", ""),
+                    "relpath": metadata.get("relpath", ""),
+                    "start_line": metadata.get("start_line", 0),
+                    "end_line": metadata.get("end_line", 0),
+                    "length": metadata.get("end_line", 0) - metadata.get("start_line", 0) + 1,
+                    "content": text,
+                }
+                for text, metadata in chunks_with_metadata
+            ]
+
+        with self.timed("symbols"):
+            attach_symbols(chunks, extract_symbols(tree, source, language))
+
+        self.files += 1
+        self.bytes += len(source)
+        self.chunks += len(chunks)
+        return chunks
+
+    def iter_chunks(
+        self, file_paths: Iterable[str], base_dir: Optional[str] = None, language: str = "c"
+    ) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """Stream (file_path, chunks) pairs for each file in turn."""
+        for file_path in file_paths:
+            yield file_path, self.chunk_file(file_path, base_dir, language)
+
+    def stats(self) -> Dict[str, float]:
+        """Snapshot of the session's counters and phase timings."""
+        return {"files": self.files, "bytes": self.bytes, "chunks": self.chunks, **self.timings}
+
+    def add_stats(self, stats: Dict[str, float]) -> None:
+        """Fold in counters and timings from another session (e.g. a worker process)."""
+        self.files += int(stats.get("files", 0))
+        self.bytes += int(stats.get("bytes", 0))
+        self.chunks += int(stats.get("chunks", 0))
+        for phase in self.PHASES:
+            self.timings[phase] += stats.get(phase, 0.0)
+
+    def report(self) -> str:
+        """Summarize files processed and time spent per phase."""
+        total = sum(self.timings.values())
+        lines = [f"Chunked {self.files} files ({self.bytes / 1e6:.2f} MB) into {self.chunks} chunks"]
+        for phase in self.PHASES:
+            seconds = self.timings[phase]
+            share = 100 * seconds / total if total else 0.0
+            lines.append(f"  {phase:<10} {seconds:8.3f} s  {share:5.1f}%")
+        return "\n".join(lines)
@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
-import json
 import sys
 import argparse
 import os
+import importlib.util
 from typing import List, Dict, Any, Optional, Tuple
 
+# Chunk files are read with chunk_store.py (JSONL or legacy JSON array)
+_chunk_store_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chunk_store.py")
+_spec = importlib.util.spec_from_file_location("chunk_store", _chunk_store_path)
+chunk_store = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(chunk_store)
+
 def check_requirements(model: str) -> bool:
     """
     Check if the required packages for the specified model are installed.
@@ -276,7 +282,7 @@ def main():
     # Query command
     query_parser = subparsers.add_parser("query", help="Query an LLM with code chunks and a question")
     query_parser.add_argument("model", choices=["gpt-3.5", "claude-3.7"], help="LLM to use for the query")
-    query_parser.add_argument("chunks_file", help="JSON file containing code chunks")
+    query_parser.add_argument("chunks_file", help="JSONL or JSON file containing code chunks")
     query_parser.add_argument("question", help="Question to ask the LLM")
     
     # Judge command
@@ -304,10 +310,10 @@ def query_llm(model: str, chunks_file: str, question: str) -> None:
     
     Args:
         model: The language model to use (gpt-3.5 or claude-3.7)
-        chunks_file: Path to a JSON file containing code chunks
+        chunks_file: Path to a JSONL or JSON file containing code chunks
         question: The question to ask the language model about the code
     """
-    # 1. Load the code chunks from the JSON file
+    # 1. Load the code chunks from the chunk file
     chunks = load_code_chunks(chunks_file)
     if not chunks:
         sys.exit(1)
@@ -330,23 +336,21 @@ def query_llm(model: str, chunks_file: str, question: str) -> None:
 
 def load_code_chunks(chunks_file: str) -> Optional[List[Dict[str, Any]]]:
     """
-    Load code chunks from a JSON file.
+    Load code chunks from a JSONL or JSON-array chunk file.
     
     Args:
-        chunks_file: Path to the JSON file containing code chunks
+        chunks_file: Path to the file containing code chunks
     
     Returns:
         A list of code chunk dictionaries, or None if there was an error
     """
     try:
-        with open(chunks_file, 'r') as f:
-            chunks = json.load(f)
-        return chunks
+        return chunk_store.load_chunks(chunks_file)
     except FileNotFoundError:
         print(f"Error: Chunks file '{chunks_file}' not found")
         return None
-    except json.JSONDecodeError:
-        print(f"Error: Chunks file '{chunks_file}' is not valid JSON")
+    except ValueError:
+        print(f"Error: Chunks file '{chunks_file}' is not valid JSON or JSONL")
         return None
     except Exception as e:
         print(f"Error loading chunks file: {str(e)}")
@@ -6,56 +6,164 @@ This script provides functionality for chunking source code, indexing those chun
 ChromaDB vector database, and retrieving relevant code snippets based on semantic similarity.
 
 Usage:
-    python code-rag.py chunk <path-to-source-tree> [<output-json-file>] [--language/-l <language>]
-    python code-rag.py index <codebase>
-    python code-rag.py retrieve <codebase> <user prompt for vector similarity search>
+    python code-rag.py chunk <path-to-source-tree> [<output-jsonl-file>] [--language/-l <language>] [--jobs/-j N] [--full]
+    python code-rag.py index <codebase> [--incremental] [--concurrency N] [--batch-tokens N] [--api-base URL]
+    python code-rag.py retrieve <codebase> <user prompt for vector similarity search> [--server URL]
+    python code-rag.py retrieve <codebase> --queries-file <file with one query per line>
+    python code-rag.py retrieve <codebase> <user prompt> [--hybrid] [--rerank [--fetch-factor N]] [--expand TOKENS]
+    python code-rag.py serve <codebase> [--host HOST] [--port PORT]
     python code-rag.py resetdb <codebase>
     python code-rag.py view <codebase>
 
 Example:
     python code-rag.py chunk ../xv6-riscv
-    python code-rag.py chunk ../xv6-riscv --language c
-    python code-rag.py chunk ../python-project xv6-riscv.json -l python
-    python code-rag.py index xv6-riscv
+    python code-rag.py chunk ../python-project python-project.jsonl -l python
+    python code-rag.py chunk ../linux --jobs 16
+    python code-rag.py index xv6-riscv --incremental
+    python code-rag.py index xv6-riscv --concurrency 8 --api-base http://localhost:8000/v1
     python code-rag.py retrieve xv6-riscv "how does file system initialization work?"
+    python code-rag.py retrieve xv6-riscv --queries-file questions.txt -k 3
+    python code-rag.py retrieve xv6-riscv uvmcopy
+    python code-rag.py retrieve xv6-riscv "how are pipes read?" --hybrid --rerank --expand 1500
+    python code-rag.py serve xv6-riscv --port 8088
+    python code-rag.py retrieve xv6-riscv "how does fork work?" --server http://localhost:8088
     python code-rag.py resetdb xv6-riscv
     python code-rag.py view codebase
 """
 
 import os
+import re
 import sys
 import json
+import hashlib
+import time
+import random
 import argparse
+import multiprocessing
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 import importlib.util
 import chromadb
+from chromadb import EmbeddingFunction
 from chromadb.utils import embedding_functions
 from chromadb.errors import InvalidCollectionException
 import openai
 
-# Import the CodeSplitter
-try:
-    # Using importlib to handle the code-meta.py import
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    code_meta_path = os.path.join(script_dir, "code-meta.py")
-    
-    spec = importlib.util.spec_from_file_location("code_meta", code_meta_path)
-    code_meta = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(code_meta)
-    CodeSplitter = code_meta.CodeSplitter
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+def load_local_module(name, filename):
+    """Import a module from a file next to this script (the names may contain hyphens)."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(script_dir, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# The embedding cache, chunk store, lexical index and reranker only need the
+# standard library and numpy
+EmbeddingCache = load_local_module("embedding_cache", "embedding_cache.py").EmbeddingCache
+chunk_store = load_local_module("chunk_store", "chunk_store.py")
+ChunkWriter = chunk_store.ChunkWriter
+iter_chunks = chunk_store.iter_chunks
+make_chunk_id = chunk_store.make_chunk_id
+LexicalIndex = load_local_module("lexical_index", "lexical_index.py").LexicalIndex
+Reranker = load_local_module("reranker", "reranker.py").Reranker
+
+_code_meta = None
+
+def load_code_meta():
+    """Import code-meta.py (CodeSplitter and ChunkingSession) on first use.
     
-    from llama_index.core.schema import Document
-except ImportError as e:
-    print(f"Error: {e}")
-    print("Please ensure you have the required packages installed:")
-    print("pip install llama-index tree-sitter tree-sitter-languages chromadb openai")
-    sys.exit(1)
+    It pulls in llama-index and tree-sitter, which take seconds to import and
+    are only needed for chunking, so retrieval does not load them.
+    """
+    global _code_meta
+    if _code_meta is None:
+        try:
+            # Using importlib to handle the code-meta.py import
+            _code_meta = load_local_module("code_meta", "code-meta.py")
+        except ImportError as e:
+            print(f"Error: {e}")
+            print("Please ensure you have the required packages installed:")
+            print("pip install llama-index tree-sitter tree-sitter-languages chromadb openai")
+            sys.exit(1)
+    return _code_meta
 
 # Constants
 DEFAULT_DB_DIRECTORY = "code_chunks_db"
 COLLECTION_NAME = "code_chunks"
+EMBEDDING_MODEL = "text-embedding-ada-002"
+#EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Indexing pipeline defaults. The embeddings API accepts up to 2048 inputs per
+# request; token budgets well below the per-request limit keep each request short.
+DEFAULT_CONCURRENCY = 4
+DEFAULT_BATCH_TOKENS = 32000
+MAX_BATCH_ITEMS = 2048
+MAX_RETRIES = 8
+
+# Queries per collection.query call; each call embeds its queries in one request
+QUERY_BATCH_SIZE = 1024
+
+# Hybrid retrieval: the BM25 index is saved in the database directory under
+# this name. Each retriever contributes HYBRID_FETCH_FACTOR * top_k candidates,
+# fused with reciprocal-rank fusion: score = sum of 1 / (RRF_K + rank).
+LEXICAL_INDEX_FILE = "lexical-index.json"
+HYBRID_FETCH_FACTOR = 4
+RRF_K = 60
+
+# Call-graph expansion considers at most this many neighbouring definitions per query
+MAX_EXPANSION_DEFINITIONS = 32
+
+# With reranking, the first stage fetches this many times top_k candidates
+RERANK_FETCH_FACTOR = 10
+
+# A query that is just a symbol name, e.g. "uvmcopy", "sys_fork()" or "struct proc"
+SYMBOL_QUERY_RE = re.compile(r"^\s*(?:(?:struct|union|enum)\s+)?([A-Za-z_]\w*)\s*(?:\(\s*\))?\s*$")
+
+_embedding_cache = None
 
-def create_openai_ef():
+def get_embedding_cache():
+    """Return the process-wide EmbeddingCache, opening it on first use."""
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache()
+    return _embedding_cache
+
+class CachedEmbeddingFunction(EmbeddingFunction):
+    """ChromaDB embedding function that looks texts up in an EmbeddingCache
+    and only passes cache misses to the wrapped embedding function.
+    
+    model_name is the cache key from embedding_cache_key, so re-indexing
+    unchanged chunks or repeating a query does not call the API again, and
+    vectors from one endpoint are never served for another. --no-cache on
+    index and retrieve bypasses the cache.
+    """
+    
+    def __init__(self, embedding_function, cache, model_name):
+        self._embedding_function = embedding_function
+        self._cache = cache
+        self._model_name = model_name
+    
+    def __call__(self, input):
+        return self._cache.embed(self._model_name, list(input), self._embedding_function)
+
+OPENAI_API_BASE = "https://api.openai.com/v1"
+
+def embedding_cache_key(api_base=None):
+    """Model name under which embeddings from api_base are cached.
+    
+    The endpoint is part of the key, so vectors from another server (such as
+    stub-embedding-server.py) are never served for OpenAI's model.
+    """
+    api_base = (api_base or os.environ.get("OPENAI_BASE_URL") or OPENAI_API_BASE).rstrip("/")
+    if api_base == OPENAI_API_BASE:
+        api_base = "openai"
+    return f"{api_base}/{EMBEDDING_MODEL}"
+
+def create_openai_ef(api_base=None, use_cache=True):
     """Create OpenAI embedding function for ChromaDB."""
     # Check for API key in environment
     if "OPENAI_API_KEY" not in os.environ:
@@ -63,12 +171,81 @@ def create_openai_ef():
         print("Please set your OpenAI API key with: export OPENAI_API_KEY='your-api-key'")
         sys.exit(1)
         
-    return embedding_functions.OpenAIEmbeddingFunction(
+    embedding_function = embedding_functions.OpenAIEmbeddingFunction(
+        api_key=os.environ["OPENAI_API_KEY"],
+        model_name=EMBEDDING_MODEL,
+        api_base=api_base or os.environ.get("OPENAI_BASE_URL")
+    )
+    if not use_cache:
+        return embedding_function
+    return CachedEmbeddingFunction(embedding_function, get_embedding_cache(),
+                                   embedding_cache_key(api_base))
+
+def create_openai_client(api_base=None):
+    """Create an OpenAI client for the indexing pipeline.
+    
+    The client's own retries are disabled; embed_batch retries with backoff.
+    """
+    return openai.OpenAI(
         api_key=os.environ["OPENAI_API_KEY"],
-        #model_name="text-embedding-3-small"
-        model_name="text-embedding-ada-002"
+        base_url=api_base or os.environ.get("OPENAI_BASE_URL"),
+        max_retries=0
     )
 
+def estimate_tokens(text):
+    """Rough token count for batching (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+def token_batches(documents, max_tokens=DEFAULT_BATCH_TOKENS, max_items=MAX_BATCH_ITEMS):
+    """Split documents into (start, end) ranges of at most max_tokens estimated tokens."""
+    start = 0
+    tokens = 0
+    for i, document in enumerate(documents):
+        document_tokens = estimate_tokens(document)
+        if i > start and (tokens + document_tokens > max_tokens or i - start >= max_items):
+            yield start, i
+            start = i
+            tokens = 0
+        tokens += document_tokens
+    if start < len(documents):
+        yield start, len(documents)
+
+def retry_delay(error, attempt):
+    """Seconds to wait before retrying: the server's Retry-After if it sent one,
+    otherwise exponential backoff with jitter."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return min(60.0, 0.5 * 2 ** attempt) * (0.5 + random.random())
+
+def embed_batch(client, texts, cache=None):
+    """Embed a batch of texts, retrying rate limits and transient errors.
+    
+    With a cache, only texts missing from it are sent to the API; they are
+    cached under the client's endpoint and model (see embedding_cache_key).
+    Returns (embeddings, number of retries).
+    """
+    retries = 0
+    
+    def call_api(texts):
+        nonlocal retries
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+                retries += attempt
+                return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+            except (openai.RateLimitError, openai.APIConnectionError,
+                    openai.APITimeoutError, openai.InternalServerError) as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                time.sleep(retry_delay(e, attempt))
+    
+    if cache is None:
+        return call_api(texts), retries
+    return cache.embed(embedding_cache_key(str(client.base_url)), texts, call_api), retries
+
 def find_source_files(directory, language="c"):
     """Find all source files in directory and subdirectories based on language."""
     source_files = []
@@ -80,57 +257,163 @@ def find_source_files(directory, language="c"):
                 source_files.append(os.path.join(root, file))
     return source_files
 
-def process_file(file_path, base_dir, language="c"):
-    """Process a source file and return its chunks with metadata."""
-    try:
-        # Read the file content
-        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-            code = f.read()
-        
-        # Create a Document from the code with file path information
-        document = Document(
-            text=code,
-            metadata={
-                "filepath": file_path,
-                "base_dir": base_dir
-            }
-        )
-        
-        # Configure the CodeSplitter
-        code_splitter = CodeSplitter(
-            language=language,
-            chunk_lines=60,  # Adjust as needed
-            chunk_lines_overlap=5,  # Adjust as needed
-            max_chars=2048,  # Adjust as needed
-        )
-        
-        # Split the document into nodes with enhanced metadata
-        nodes = code_splitter.get_nodes_from_documents([document])
-        
-        # Convert nodes to the required format
-        chunks = []
-        for node in nodes:
-            chunk = {
-                "filepath": node.metadata.get("filepath", ""),
-                "filename": node.metadata.get("filename", ""),
-                "relpath": node.metadata.get("relpath", ""),
-                "start_line": node.metadata.get("start_line", 0),
-                "end_line": node.metadata.get("end_line", 0),
-                "length": node.metadata.get("end_line", 0) - node.metadata.get("start_line", 0) + 1,
-                "content": node.text
-            }
-            chunks.append(chunk)
-        
-        return chunks
+def new_chunking_session():
+    """Create a ChunkingSession with the chunking parameters used by this script."""
+    return load_code_meta().ChunkingSession(
+        chunk_lines=60,  # Adjust as needed
+        chunk_lines_overlap=5,  # Adjust as needed
+        max_chars=2048,  # Adjust as needed
+    )
+
+def process_file(file_path, base_dir, language="c", session=None):
+    """Process a source file and return its chunks with metadata, or None if
+    the file could not be read or parsed.
     
+    Pass the same session for every file so its CodeSplitter and tree-sitter
+    parser are reused.
+    """
+    session = session or new_chunking_session()
+    try:
+        return session.chunk_file(file_path, base_dir, language)
     except Exception as e:
         print(f"Error processing file {file_path}: {e}")
         import traceback
         traceback.print_exc()
-        return []
+        return None
+
+# ChunkingSession of a --jobs worker process, created by _init_chunk_worker
+_worker_session = None
+
+def _init_chunk_worker():
+    """Give each worker process its own session, and so its own tree-sitter parser."""
+    global _worker_session
+    _worker_session = new_chunking_session()
 
-def chunk_source_tree(source_dir, output_file, language="c"):
-    """Process all files in the source directory and save chunks to a JSON file."""
+def _chunk_file_in_worker(args):
+    """Chunk one file in a worker; returns the chunks and the session stats it added."""
+    file_path, base_dir, language = args
+    before = _worker_session.stats()
+    chunks = process_file(file_path, base_dir, language, _worker_session)
+    after = _worker_session.stats()
+    return chunks, {key: after[key] - before[key] for key in after}
+
+def iter_file_chunks(source_files, base_dir, language, session, jobs=1):
+    """Yield (file_path, chunks) in source_files order, using jobs worker processes."""
+    if jobs <= 1:
+        for file_path in source_files:
+            yield file_path, process_file(file_path, base_dir, language, session)
+        return
+    
+    tasks = [(file_path, base_dir, language) for file_path in source_files]
+    # Hand out several files per task to amortize IPC, but keep workers balanced
+    chunksize = max(1, min(64, len(tasks) // (jobs * 8)))
+    with multiprocessing.Pool(jobs, initializer=_init_chunk_worker) as pool:
+        # imap returns results in task order, so the output is deterministic
+        results = pool.imap(_chunk_file_in_worker, tasks, chunksize=chunksize)
+        for file_path, (chunks, stats) in zip(source_files, results):
+            session.add_stats(stats)
+            yield file_path, chunks
+
+MANIFEST_VERSION = 2
+SYMBOL_INDEX_VERSION = 2
+
+def manifest_path(output_file):
+    """Path of the manifest that goes with a chunk file."""
+    return f"{os.path.splitext(output_file)[0]}.manifest.json"
+
+def symbol_index_path(output_file):
+    """Path of the symbol index that goes with a chunk file (or <codebase>.db)."""
+    return f"{os.path.splitext(output_file)[0]}.symbols.json"
+
+def file_fingerprint(file_path, previous=None):
+    """Return size, mtime_ns and sha256 of a file.
+    
+    If previous (a manifest entry) has the same size and mtime the file is
+    assumed unchanged and its stored hash is reused without reading the file.
+    """
+    stat = os.stat(file_path)
+    if previous and previous["size"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns:
+        sha256 = previous["sha256"]
+    else:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+
+def chunking_settings(source_dir, language):
+    """Settings that must match for a manifest's chunks to be reused."""
+    session = new_chunking_session()
+    return {
+        "source_dir": source_dir,
+        "language": language,
+        "chunk_lines": session.chunk_lines,
+        "chunk_lines_overlap": session.chunk_lines_overlap,
+        "max_chars": session.max_chars,
+        # Stored chunks carry their symbols; older chunks have none
+        "symbols": SYMBOL_INDEX_VERSION,
+    }
+
+def load_previous_manifest(output_file, settings):
+    """Return the manifest file entries of the previous run, or {} when there is
+    no usable previous run."""
+    manifest_file = manifest_path(output_file)
+    if not (os.path.exists(manifest_file) and os.path.exists(output_file)):
+        return {}
+    try:
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+    except Exception as e:
+        print(f"Ignoring previous run: {e}")
+        return {}
+    
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    if manifest.get("settings") != settings:
+        print("Chunking settings changed; re-chunking every file")
+        return {}
+    return manifest.get("files", {})
+
+def write_manifest(output_file, settings, files):
+    """Write the manifest for a chunk file."""
+    with open(manifest_path(output_file), 'w', encoding='utf-8') as f:
+        json.dump({"version": MANIFEST_VERSION, "settings": settings, "files": files}, f, indent=2)
+
+def add_chunk_symbols(symbols, relpath, chunks):
+    """Add the symbols defined in a file's chunks to a name -> definitions map."""
+    for chunk in chunks:
+        for symbol in chunk.get("symbols", ()):
+            definition = {
+                "kind": symbol["kind"],
+                "relpath": relpath,
+                "start_line": symbol["start_line"],
+                "end_line": symbol["end_line"],
+                "chunk_ids": symbol["chunk_ids"],
+            }
+            if "calls" in symbol:
+                definition["calls"] = symbol["calls"]
+            symbols.setdefault(symbol["name"], []).append(definition)
+
+def write_symbol_index(output_file, symbols):
+    """Write the symbol index for a chunk file."""
+    with open(symbol_index_path(output_file), 'w', encoding='utf-8') as f:
+        json.dump({"version": SYMBOL_INDEX_VERSION, "symbols": symbols}, f)
+
+def chunk_source_tree(source_dir, output_file, language="c", jobs=1, full=False):
+    """Chunk the files in the source directory that changed since the last run
+    and stream all chunks to a JSONL chunk file.
+    
+    <output>.manifest.json records the size, mtime, SHA-256, chunk IDs and
+    byte span in the chunk file of every source file. Files whose hash is
+    unchanged are not re-chunked; their stored chunks are copied from the
+    previous chunk file. full=True ignores the manifest.
+    
+    The symbols defined in the chunks (functions, types and macros) are
+    collected into <output>.symbols.json, mapping each name to its
+    definitions' files, line spans and chunk IDs. Function definitions also
+    list the functions they call, which makes the index a call graph.
+    """
     # Check if the directory exists
     if not os.path.isdir(source_dir):
         print(f"Error: Directory '{source_dir}' does not exist.")
@@ -143,21 +426,91 @@ def chunk_source_tree(source_dir, output_file, language="c"):
     source_files = find_source_files(abs_dir_path, language)
     print(f"Found {len(source_files)} source files in {abs_dir_path}")
     
-    # Process each file and collect chunks
-    all_chunks = []
-    for file_path in source_files:
-        print(f"Processing {file_path}")
-        chunks = process_file(file_path, abs_dir_path, language)
-        all_chunks.extend(chunks)
-        print(f"  - Generated {len(chunks)} chunks")
+    # Compare the tree against the previous run's manifest
+    settings = chunking_settings(abs_dir_path, language)
+    previous = {} if full else load_previous_manifest(output_file, settings)
+    relpaths = [os.path.relpath(file_path, abs_dir_path) for file_path in source_files]
+    files = {}
+    changed_files = []
+    for file_path, relpath in zip(source_files, relpaths):
+        entry = previous.get(relpath)
+        files[relpath] = file_fingerprint(file_path, entry)
+        if entry is None or entry["sha256"] != files[relpath]["sha256"]:
+            changed_files.append(file_path)
+    added = sum(relpath not in previous for relpath in relpaths)
+    removed = len(set(previous) - set(relpaths))
+    print(f"{len(source_files) - len(changed_files)} unchanged, "
+          f"{len(changed_files) - added} changed, {added} added, {removed} removed")
     
-    # Save the chunks to a JSON file
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(all_chunks, f, indent=2)
+    # Chunk the changed files, reusing one parser per process, and copy the
+    # stored chunks of unchanged files from the previous chunk file. Chunks are
+    # written in file order as they become available.
+    session = new_chunking_session()
+    # changed_files is in source_files order, so changed_chunks yields in step with the loop
+    changed_set = set(changed_files)
+    changed_chunks = iter_file_chunks(changed_files, abs_dir_path, language, session, jobs)
+    changed_count = 0
+    failed_count = 0
+    symbols = {}
+    start_time = time.perf_counter()
+    progress_every = max(1, len(changed_files) // 20)
+    previous_file = open(output_file, 'rb') if previous else None
+    try:
+        with ChunkWriter(output_file) as writer:
+            for file_path, relpath in zip(source_files, relpaths):
+                entry = previous.get(relpath)
+                if file_path in changed_set:
+                    _, chunks = next(changed_chunks)
+                    changed_count += 1
+                    if jobs <= 1:
+                        print(f"Processing {file_path}")
+                        if chunks is not None:
+                            print(f"  - Generated {len(chunks)} chunks")
+                    elif changed_count % progress_every == 0 or changed_count == len(changed_files):
+                        elapsed = time.perf_counter() - start_time
+                        print(f"  [{changed_count}/{len(changed_files)} files] {session.chunks} chunks, "
+                              f"{changed_count / elapsed:.1f} files/s")
+                else:
+                    try:
+                        chunks = chunk_store.read_chunk_span(previous_file, *entry["span"])
+                    except ValueError:
+                        chunks = None
+                    if chunks is None or [chunk.get("id") for chunk in chunks] != entry["chunk_ids"]:
+                        # The chunk file no longer matches its manifest
+                        print(f"Stored chunks of {relpath} are out of date; re-chunking")
+                        chunks = process_file(file_path, abs_dir_path, language, session)
+                
+                if chunks is None:
+                    # Leave the file out of the manifest so the next run retries it
+                    del files[relpath]
+                    failed_count += 1
+                    continue
+                with session.timed("serialize"):
+                    start = writer.position
+                    writer.write_many(chunks)
+                    files[relpath]["chunk_ids"] = [chunk["id"] for chunk in chunks]
+                    files[relpath]["span"] = [start, writer.position]
+                add_chunk_symbols(symbols, relpath, chunks)
+            chunk_count = writer.count
+    finally:
+        if previous_file is not None:
+            previous_file.close()
+    chunk_time = time.perf_counter() - start_time
+    write_manifest(output_file, settings, files)
+    write_symbol_index(output_file, symbols)
     
-    print(f"\nSuccessfully processed {len(source_files)} files.")
-    print(f"Generated {len(all_chunks)} chunks.")
+    print(f"\nSuccessfully processed {len(changed_files) - failed_count} of {len(source_files)} files.")
+    if failed_count:
+        print(f"Failed to chunk {failed_count} files; they are retried on the next run.")
+    print(f"Generated {chunk_count} chunks.")
     print(f"Results saved to {output_file}")
+    print(f"Indexed {sum(map(len, symbols.values()))} definitions of {len(symbols)} symbols "
+          f"in {symbol_index_path(output_file)}")
+    if chunk_time > 0 and changed_files:
+        print(f"Throughput with {jobs} process(es): {len(changed_files) / chunk_time:.1f} files/s, "
+              f"{session.bytes / 1e6 / chunk_time:.2f} MB/s, "
+              f"{session.chunks / chunk_time:.1f} chunks/s ({chunk_time:.2f} s)")
+    print(session.report())
 
 def get_chroma_client(db_path=DEFAULT_DB_DIRECTORY):
     """Get or create a ChromaDB client."""
@@ -178,106 +531,636 @@ def get_collection(client, embedding_function=None):
             embedding_function=embedding_function
         )
 
-def index_chunks(chunk_file, db_path=DEFAULT_DB_DIRECTORY):
-    """Index chunks from a JSON file into ChromaDB with OpenAI embeddings."""
-    # Load chunks from JSON
-    try:
-        with open(chunk_file, 'r') as f:
-            chunks = json.load(f)
-    except Exception as e:
-        print(f"Error loading chunks from {chunk_file}: {e}")
-        sys.exit(1)
+def get_chunk_id(chunk):
+    """Return a chunk's content-addressed ID, computing it for chunk files
+    written before chunks carried one."""
+    return chunk.get("id") or make_chunk_id(
+        chunk["relpath"], chunk["start_line"], chunk["end_line"], chunk["content"]
+    )
+
+def collection_ids(collection, page_size=10000):
+    """Return the set of all IDs stored in a collection, fetched page by page."""
+    ids = set()
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=page_size, offset=offset)["ids"]
+        ids.update(page)
+        if len(page) < page_size:
+            return ids
+        offset += page_size
+
+def add_chunks_pipelined(collection, ids, documents, metadatas, client,
+                         concurrency=DEFAULT_CONCURRENCY, batch_tokens=DEFAULT_BATCH_TOKENS,
+                         cache=None):
+    """Embed and add chunks to the collection with overlapping requests.
     
-    print(f"Loaded {len(chunks)} chunks from {chunk_file}")
+    Batches are sized by estimated token count (token_batches). Up to
+    concurrency embedding requests run in worker threads, and embed_batch
+    retries rate-limit and server errors with exponential backoff. Finished
+    batches are added to the collection in order by this thread while later
+    batches are still being embedded. Embeddings found in cache are not
+    requested again.
+    """
+    batches = list(token_batches(documents, batch_tokens))
+    pending = deque()
+    retries = 0
+    tokens = 0
+    start_time = time.perf_counter()
     
-    # Setup ChromaDB with OpenAI embeddings
-    embedding_function = create_openai_ef()
-    client = get_chroma_client(db_path)
-    collection = get_collection(client, embedding_function)
+    def write_oldest():
+        nonlocal retries
+        start, end, future = pending.popleft()
+        embeddings, batch_retries = future.result()
+        retries += batch_retries
+        print(f"Indexing chunks {start} to {end-1}...")
+        collection.add(
+            ids=ids[start:end],
+            embeddings=embeddings,
+            documents=documents[start:end],
+            metadatas=metadatas[start:end]
+        )
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for start, end in batches:
+            # Bound the finished-but-unwritten batches held in memory
+            if len(pending) >= 2 * concurrency:
+                write_oldest()
+            tokens += sum(estimate_tokens(d) for d in documents[start:end])
+            pending.append((start, end, executor.submit(embed_batch, client, documents[start:end], cache)))
+        while pending:
+            write_oldest()
+    
+    elapsed = time.perf_counter() - start_time
+    if documents and elapsed > 0:
+        print(f"Embedded {len(documents)} chunks (~{tokens} tokens) in {len(batches)} batches "
+              f"in {elapsed:.2f} s: {len(documents) / elapsed:.1f} chunks/s, "
+              f"{retries} retries, concurrency {concurrency}")
+    if cache is not None:
+        print(cache.report())
+
+def index_chunks(chunk_file, db_path=DEFAULT_DB_DIRECTORY, incremental=False,
+                 concurrency=DEFAULT_CONCURRENCY, batch_tokens=DEFAULT_BATCH_TOKENS, api_base=None,
+                 use_cache=True):
+    """Index chunks from a chunk file into ChromaDB with OpenAI embeddings.
+    
+    Chunks are stored under their content-addressed IDs. With incremental=True
+    the collection is diffed against the chunk file: only chunks whose IDs are
+    not yet in the collection are embedded and added, and IDs that no longer
+    appear in the chunk file are deleted. Embedding runs through
+    add_chunks_pipelined, consulting the embedding cache unless use_cache
+    is False. api_base (or OPENAI_BASE_URL) points it at another
+    OpenAI-compatible server, such as stub-embedding-server.py.
     
-    # Prepare data for batch upload
+    The BM25 index for hybrid retrieval is rebuilt from all chunks and saved
+    as LEXICAL_INDEX_FILE in db_path.
+    """
+    # Prepare data for batch upload, reading the chunk file one chunk at a time
     ids = []
     documents = []
     metadatas = []
     
+    chunk_count = 0
     skipped_count = 0
-    for i, chunk in enumerate(chunks):
-        # Skip chunks with empty content
-        if not chunk["content"]:
-            skipped_count += 1
-            continue
+    seen_ids = set()
+    try:
+        for chunk in iter_chunks(chunk_file):
+            chunk_count += 1
+            # Skip chunks with empty content
+            if not chunk["content"]:
+                skipped_count += 1
+                continue
             
-        chunk_id = f"chunk_{i}"
-        ids.append(chunk_id)
-        documents.append(chunk["content"])
-        
-        # Extract metadata (excluding content to avoid duplication)
-        metadata = {
-            "filepath": chunk["filepath"],
-            "filename": chunk["filename"],
-            "relpath": chunk["relpath"],
-            "start_line": chunk["start_line"],
-            "end_line": chunk["end_line"],
-            "length": chunk["length"]
-        }
-        metadatas.append(metadata)
-    
-    # Add documents to collection in batches
-    batch_size = 100
-    for i in range(0, len(documents), batch_size):
-        end_idx = min(i + batch_size, len(documents))
-        print(f"Indexing chunks {i} to {end_idx-1}...")
+            # Identical chunks would share an ID; ChromaDB rejects duplicates in one add
+            chunk_id = get_chunk_id(chunk)
+            if chunk_id in seen_ids:
+                continue
+            seen_ids.add(chunk_id)
+            ids.append(chunk_id)
+            documents.append(chunk["content"])
+            
+            # Extract metadata (excluding content to avoid duplication)
+            metadata = {
+                "filepath": chunk["filepath"],
+                "filename": chunk["filename"],
+                "relpath": chunk["relpath"],
+                "start_line": chunk["start_line"],
+                "end_line": chunk["end_line"],
+                "length": chunk["length"]
+            }
+            metadatas.append(metadata)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error loading chunks from {chunk_file}: {e}")
+        sys.exit(1)
+    
+    print(f"Loaded {chunk_count} chunks from {chunk_file}")
+    
+    # The lexical index covers every chunk, including those already embedded
+    start_time = time.perf_counter()
+    lexical = LexicalIndex.build(zip(ids, documents))
+    lexical_time = time.perf_counter() - start_time
+    
+    # Setup ChromaDB with OpenAI embeddings
+    embedding_function = create_openai_ef(api_base, use_cache)
+    client = get_chroma_client(db_path)
+    collection = get_collection(client, embedding_function)
+    
+    if incremental:
+        existing_ids = collection_ids(collection)
+        stale_ids = sorted(existing_ids - seen_ids)
+        keep = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing_ids]
+        print(f"{len(ids) - len(keep)} chunks already indexed, {len(keep)} new, "
+              f"{len(stale_ids)} to delete")
         
-        collection.add(
-            ids=ids[i:end_idx],
-            documents=documents[i:end_idx],
-            metadatas=metadatas[i:end_idx]
-        )
+        # Delete vanished chunks first; deletes need no embeddings
+        batch_size = 1000
+        for i in range(0, len(stale_ids), batch_size):
+            collection.delete(ids=stale_ids[i:i + batch_size])
+        
+        ids = [ids[i] for i in keep]
+        documents = [documents[i] for i in keep]
+        metadatas = [metadatas[i] for i in keep]
+    
+    # Embed and add documents to the collection in token-sized batches
+    try:
+        add_chunks_pipelined(collection, ids, documents, metadatas,
+                             create_openai_client(api_base), concurrency, batch_tokens,
+                             get_embedding_cache() if use_cache else None)
+    except openai.OpenAIError as e:
+        print(f"Error embedding chunks: {e}")
+        print("Chunks that were already added are kept; rerun with --incremental to resume.")
+        sys.exit(1)
     
     count = collection.count()
     print(f"Successfully indexed {count} chunks in ChromaDB")
+    
+    lexical.save(os.path.join(db_path, LEXICAL_INDEX_FILE))
+    print(f"Built lexical index of {len(lexical)} chunks and {len(lexical.postings)} terms "
+          f"in {lexical_time:.2f} seconds")
     if skipped_count > 0:
         print(f"Skipped {skipped_count} chunks with empty content")
 
-def retrieve_chunks(query, top_k=5, db_path=DEFAULT_DB_DIRECTORY):
+def format_result(chunk_id, metadata, document):
+    """Result dictionary of a chunk returned by ChromaDB."""
+    return {
+        "id": chunk_id,
+        "filepath": metadata["filepath"],
+        "filename": metadata["filename"],
+        "relpath": metadata["relpath"],
+        "start_line": metadata["start_line"],
+        "end_line": metadata["end_line"],
+        "length": metadata["length"],
+        "content": document
+    }
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuse ranked lists of IDs; returns all IDs, best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+class CallGraph:
+    """In-memory adjacency index over the function definitions of a symbol index.
+    
+    Calls name their callee, so each call is linked to the definitions of that
+    name, preferring those in the caller's directory (xv6 has a printf in both
+    kernel/ and user/). Definitions are numbered; callees and callers hold the
+    numbers of each definition's neighbours.
+    """
+    
+    def __init__(self, symbols):
+        self.definitions = []
+        self.by_chunk = {}
+        by_name = {}
+        for name, definitions in symbols.items():
+            for definition in definitions:
+                if definition["kind"] != "function":
+                    continue
+                number = len(self.definitions)
+                self.definitions.append((name, definition))
+                by_name.setdefault(name, []).append(number)
+                for chunk_id in definition["chunk_ids"]:
+                    self.by_chunk.setdefault(chunk_id, []).append(number)
+        
+        self.callees = [[] for _ in self.definitions]
+        self.callers = [[] for _ in self.definitions]
+        for number, (_, definition) in enumerate(self.definitions):
+            directory = os.path.dirname(definition["relpath"])
+            for callee in definition.get("calls", ()):
+                targets = by_name.get(callee, [])
+                local = [target for target in targets
+                         if os.path.dirname(self.definitions[target][1]["relpath"]) == directory]
+                for target in local or targets:
+                    if target != number:
+                        self.callees[number].append(target)
+                        self.callers[target].append(number)
+    
+    def neighbours(self, chunk_ids, limit=MAX_EXPANSION_DEFINITIONS):
+        """Return up to limit (relation, symbol, definition) neighbours of the
+        functions defined in chunk_ids, best first.
+        
+        The callees of all those functions come first, since they show what
+        the results do, then their callers; both in chunk order and then in
+        source order within each chunk. The functions themselves are skipped.
+        """
+        sources = list(dict.fromkeys(
+            number
+            for chunk_id in chunk_ids
+            for number in sorted(self.by_chunk.get(chunk_id, ()),
+                                 key=lambda number: self.definitions[number][1]["start_line"])
+        ))
+        seen = set(sources)
+        neighbours = []
+        for relation, adjacency in (("callee", self.callees), ("caller", self.callers)):
+            for number in sources:
+                for target in adjacency[number]:
+                    if target in seen:
+                        continue
+                    seen.add(target)
+                    name, definition = self.definitions[target]
+                    neighbours.append((relation, name, definition))
+                    if len(neighbours) == limit:
+                        return neighbours
+        return neighbours
+
+class RetrievalService:
+    """Open ChromaDB client, collection and embedding function for one database.
+    
+    Creating these takes far longer than a query, so a service is created
+    once and reused for every query against its database. The lexical index
+    for hybrid queries and the symbol index are loaded on first use.
+    
+    A query that names a symbol in the codebase's symbol index (written by the
+    chunk command as <codebase>.symbols.json) is answered with the chunks of
+    its definitions, without embedding the query or searching the collection.
+    The call graph in the symbol index is loaded into a CallGraph for
+    expanding results with the callers and callees of the functions found.
+    The Reranker (reranker.py) reorders over-fetched candidates and keeps
+    the time it spends, for reporting.
+    """
+    
+    def __init__(self, db_path=DEFAULT_DB_DIRECTORY, use_cache=True):
+        # Setup ChromaDB with OpenAI embeddings
+        self.db_path = db_path
+        embedding_function = create_openai_ef(use_cache=use_cache)
+        self.client = get_chroma_client(db_path)
+        
+        try:
+            self.collection = get_collection(self.client, embedding_function)
+        except InvalidCollectionException:
+            print(f"Error: Collection '{COLLECTION_NAME}' does not exist.")
+            print("Make sure you have indexed chunks with 'python code-rag.py index <codebase>' before trying to retrieve.")
+            sys.exit(1)
+        except Exception as e:
+            print(f"Error accessing collection: {e}")
+            sys.exit(1)
+        
+        self._lexical = None
+        self._lexical_loaded = False
+        self._symbols = None
+        self._call_graph = None
+        self._reranker = None
+    
+    @property
+    def lexical(self):
+        """The LexicalIndex saved by index_chunks, or None if there is none."""
+        if not self._lexical_loaded:
+            self._lexical_loaded = True
+            path = os.path.join(self.db_path, LEXICAL_INDEX_FILE)
+            try:
+                self._lexical = LexicalIndex.load(path)
+            except (OSError, ValueError) as e:
+                print(f"Warning: no lexical index ({e}); hybrid queries use vectors only.")
+                print("Rebuild it with 'python code-rag.py index <codebase> --incremental'.")
+        return self._lexical
+    
+    @property
+    def symbols(self):
+        """Symbol name -> definitions, from the symbol index ({} if there is none)."""
+        if self._symbols is None:
+            path = symbol_index_path(self.db_path.rstrip(os.sep))
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                self._symbols = index["symbols"] if index.get("version") == SYMBOL_INDEX_VERSION else {}
+            except (OSError, ValueError, KeyError):
+                self._symbols = {}
+        return self._symbols
+    
+    @property
+    def reranker(self):
+        """Reranker using the lexical index, created on first use."""
+        if self._reranker is None:
+            self._reranker = Reranker(self.lexical)
+        return self._reranker
+    
+    @property
+    def call_graph(self):
+        """CallGraph of the symbol index, built on first use."""
+        if self._call_graph is None:
+            self._call_graph = CallGraph(self.symbols)
+        return self._call_graph
+    
+    def _fetch_chunks(self, ids):
+        """Fetch chunks by ID with one collection.get; returns ID -> result dictionary.
+        
+        IDs that are not in the collection are missing from the dictionary.
+        """
+        chunks = {}
+        wanted = list(dict.fromkeys(ids))
+        if wanted:
+            fetched = self.collection.get(ids=wanted, include=["metadatas", "documents"])
+            for chunk_id, metadata, document in zip(fetched["ids"], fetched["metadatas"],
+                                                    fetched["documents"]):
+                chunks[chunk_id] = format_result(chunk_id, metadata, document)
+        return chunks
+    
+    def expand(self, formatted_results, token_budget):
+        """Add the callees and callers of the functions in each query's results.
+        
+        Neighbouring definitions are taken from the in-memory call graph in
+        the order of CallGraph.neighbours and added whole, with all their
+        chunks, while their estimated tokens fit in token_budget (per query).
+        The chunks are fetched with one _fetch_chunks call for all queries. Added
+        results carry "expansion" ("callee" or "caller") and the "symbol" they
+        define.
+        """
+        call_graph = self.call_graph
+        candidates = [call_graph.neighbours([result["id"] for result in results])
+                      for results in formatted_results]
+        
+        chunks = self._fetch_chunks(chunk_id
+                                    for neighbours in candidates
+                                    for _, _, definition in neighbours
+                                    for chunk_id in definition["chunk_ids"])
+        
+        expanded_results = []
+        for results, neighbours in zip(formatted_results, candidates):
+            results = list(results)
+            present = {result["id"] for result in results}
+            budget = token_budget
+            for relation, name, definition in neighbours:
+                new_chunks = [chunks[chunk_id] for chunk_id in definition["chunk_ids"]
+                              if chunk_id in chunks and chunk_id not in present]
+                tokens = sum(estimate_tokens(chunk["content"]) for chunk in new_chunks)
+                if not new_chunks or tokens > budget:
+                    continue
+                budget -= tokens
+                for chunk in new_chunks:
+                    present.add(chunk["id"])
+                    results.append({**chunk, "expansion": relation, "symbol": name})
+            expanded_results.append(results)
+        return expanded_results
+    
+    def lookup_symbols(self, queries, top_k=5):
+        """Answer queries that name a known symbol from the symbol index.
+        
+        A query that is just a symbol name ("uvmcopy", "sys_fork()",
+        "struct proc") is answered with the chunks holding its definitions,
+        fetched by ID without embedding the query.
+        Returns a list with the results of each such query and None for the
+        others, which need a search.
+        """
+        wanted_ids = []
+        for query in queries:
+            match = SYMBOL_QUERY_RE.match(query)
+            definitions = self.symbols.get(match.group(1), []) if match else []
+            ids = list(dict.fromkeys(chunk_id for definition in definitions
+                                     for chunk_id in definition["chunk_ids"]))
+            wanted_ids.append(ids[:top_k])
+        
+        # One get for the chunks of all symbol queries
+        chunks = self._fetch_chunks(chunk_id for ids in wanted_ids for chunk_id in ids)
+        
+        # A symbol whose chunks are not indexed (yet) falls back to a search
+        return [[chunks[chunk_id] for chunk_id in ids if chunk_id in chunks] or None
+                for ids in wanted_ids]
+    
+    def query(self, queries, top_k=5, hybrid=False, expand=0, rerank=False,
+              fetch_factor=RERANK_FETCH_FACTOR):
+        """Retrieve the top_k chunks for each query, as one list of results per query.
+        
+        Queries naming a known symbol are looked up in the symbol index. The
+        others are sent in batches of QUERY_BATCH_SIZE; each batch is embedded
+        in one request and searched in one collection.query call. With
+        hybrid=True the vector ranking is fused with the BM25 ranking. With
+        rerank=True the search fetches fetch_factor * top_k candidates, which
+        the reranker cuts down to top_k. With expand > 0, up to that many
+        tokens of call-graph neighbours are added to each query's results.
+        
+        The reranker (reranker.py) scores candidates with a weighted sum of
+        local features: first-stage rank, BM25 score, identifier overlap,
+        file path matches and chunk length. No model is called.
+        """
+        if isinstance(queries, str):
+            raise TypeError("queries must be a list of strings, not a string; "
+                            "use retrieve_chunks for a single query")
+        queries = list(queries)
+        formatted_results = self.lookup_symbols(queries, top_k)
+        search = [i for i, results in enumerate(formatted_results) if results is None]
+        
+        query_batch = self._hybrid_batch if hybrid else self._query_batch
+        fetch_k = top_k * max(fetch_factor, 1) if rerank else top_k
+        for start in range(0, len(search), QUERY_BATCH_SIZE):
+            batch = search[start:start + QUERY_BATCH_SIZE]
+            for i, results in zip(batch, query_batch([queries[i] for i in batch], fetch_k)):
+                if rerank:
+                    results = self.reranker.rerank(queries[i], results, top_k)
+                formatted_results[i] = results
+        if expand > 0:
+            formatted_results = self.expand(formatted_results, expand)
+        return formatted_results
+    
+    def _query_batch(self, queries, top_k):
+        # Query the collection
+        results = self.collection.query(
+            query_texts=queries,
+            n_results=top_k
+        )
+        
+        # Format results to match the required output format
+        formatted_results = []
+        for i in range(len(queries)):
+            query_results = []
+            if results and results["metadatas"] and results["documents"]:
+                for chunk_id, metadata, document in zip(results["ids"][i], results["metadatas"][i],
+                                                        results["documents"][i]):
+                    query_results.append(format_result(chunk_id, metadata, document))
+            formatted_results.append(query_results)
+        
+        return formatted_results
+    
+    def _hybrid_batch(self, queries, top_k):
+        """Fuse the vector and BM25 rankings of each query with reciprocal-rank fusion.
+        
+        The BM25 index tokenizes identifiers, so exact names such as sys_fork
+        are found even when their embeddings are not close to the query.
+        Candidates are ranked by ID only; documents are fetched for the fused
+        top_k.
+        """
+        fetch_k = top_k * HYBRID_FETCH_FACTOR
+        vector_results = self.collection.query(
+            query_texts=queries,
+            n_results=fetch_k,
+            include=["distances"]
+        )
+        
+        lexical = self.lexical
+        fused_ids = []
+        for query, vector_ids in zip(queries, vector_results["ids"]):
+            rankings = [vector_ids]
+            if lexical is not None:
+                rankings.append([chunk_id for chunk_id, _ in lexical.search(query, fetch_k)])
+            fused_ids.append(reciprocal_rank_fusion(rankings)[:top_k])
+        
+        # One get for the chunks of the whole batch
+        chunks = self._fetch_chunks(chunk_id for ids in fused_ids for chunk_id in ids)
+        
+        # IDs missing from the collection (a stale lexical index) are dropped
+        return [[chunks[chunk_id] for chunk_id in ids if chunk_id in chunks]
+                for ids in fused_ids]
+
+_retrieval_services = {}
+
+def get_retrieval_service(db_path=DEFAULT_DB_DIRECTORY, use_cache=True):
+    """Return the RetrievalService for db_path, creating it on first use."""
+    key = (os.path.abspath(db_path), use_cache)
+    service = _retrieval_services.get(key)
+    if service is None:
+        service = _retrieval_services[key] = RetrievalService(db_path, use_cache)
+    return service
+
+def retrieve_chunks(query, top_k=5, db_path=DEFAULT_DB_DIRECTORY, use_cache=True, hybrid=False,
+                    expand=0, rerank=False, fetch_factor=RERANK_FETCH_FACTOR):
     """Retrieve chunks from ChromaDB based on the query."""
-    # Setup ChromaDB with OpenAI embeddings
-    embedding_function = create_openai_ef()
-    client = get_chroma_client(db_path)
+    return get_retrieval_service(db_path, use_cache).query(
+        [query], top_k, hybrid, expand, rerank, fetch_factor)[0]
+
+def retrieve_many(queries, top_k=5, db_path=DEFAULT_DB_DIRECTORY, use_cache=True, hybrid=False,
+                  expand=0, rerank=False, fetch_factor=RERANK_FETCH_FACTOR):
+    """Retrieve chunks for many queries at once; returns one result list per query.
     
+    queries is a list (or other iterable) of query strings, not a single string.
+    """
+    return get_retrieval_service(db_path, use_cache).query(
+        queries, top_k, hybrid, expand, rerank, fetch_factor)
+
+def load_queries(queries_file):
+    """Read one query per line, skipping blank lines."""
     try:
-        collection = get_collection(client, embedding_function)
-    except InvalidCollectionException:
-        print(f"Error: Collection '{COLLECTION_NAME}' does not exist.")
-        print("Make sure you have indexed chunks with 'python code-rag.py index <codebase>' before trying to retrieve.")
+        with open(queries_file, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    except OSError as e:
+        print(f"Error reading queries from {queries_file}: {e}")
         sys.exit(1)
-    except Exception as e:
-        print(f"Error accessing collection: {e}")
-        sys.exit(1)
-    
-    # Query the collection
-    results = collection.query(
-        query_texts=[query],
-        n_results=top_k
+
+def retrieve_remote(server_url, queries, top_k=5, hybrid=False, expand=0, rerank=False,
+                    fetch_factor=RERANK_FETCH_FACTOR):
+    """Send queries to a code-rag.py serve process; returns one result list per query."""
+    request = urllib.request.Request(
+        f"{server_url.rstrip('/')}/retrieve",
+        data=json.dumps({"queries": list(queries), "top_k": top_k,
+                         "hybrid": hybrid, "expand": expand,
+                         "rerank": rerank, "fetch_factor": fetch_factor}).encode("utf-8"),
+        headers={"Content-Type": "application/json"}
     )
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)["results"]
+
+def parse_retrieve_request(request):
+    """Validate the JSON body of POST /retrieve; returns the arguments of
+    RetrievalService.query or raises ValueError."""
+    if not isinstance(request, dict):
+        raise ValueError("body must be a JSON object")
+    if "queries" in request:
+        queries = request["queries"]
+        if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+            raise ValueError('"queries" must be a list of strings')
+    elif isinstance(request.get("query"), str):
+        queries = [request["query"]]
+    else:
+        raise ValueError('give "queries" (a list of strings) or "query" (a string)')
     
-    # Format results to match the required output format
-    formatted_results = []
-    
-    if results and results["metadatas"] and results["documents"]:
-        for metadata, document in zip(results["metadatas"][0], results["documents"][0]):
-            result = {
-                "filepath": metadata["filepath"],
-                "filename": metadata["filename"],
-                "relpath": metadata["relpath"],
-                "start_line": metadata["start_line"],
-                "end_line": metadata["end_line"],
-                "length": metadata["length"],
-                "content": document
-            }
-            formatted_results.append(result)
+    def integer(name, default, minimum):
+        value = request.get(name, default)
+        if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+            raise ValueError(f'"{name}" must be an integer >= {minimum}')
+        return value
+    
+    def flag(name):
+        value = request.get(name, False)
+        if not isinstance(value, bool):
+            raise ValueError(f'"{name}" must be true or false')
+        return value
+    
+    return (queries, integer("top_k", 5, 1), flag("hybrid"), integer("expand", 0, 0),
+            flag("rerank"), integer("fetch_factor", RERANK_FETCH_FACTOR, 1))
+
+class RetrievalHandler(BaseHTTPRequestHandler):
+    """HTTP front end for a RetrievalService (set as the class attribute service)."""
+    service = None
+    
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok", "db_path": self.service.db_path,
+                                 "chunks": self.service.collection.count()})
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
     
-    return formatted_results
+    def do_POST(self):
+        if self.path != "/retrieve":
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            queries, top_k, hybrid, expand, rerank, fetch_factor = parse_retrieve_request(request)
+        except ValueError as e:
+            self.send_json(400, {"error": f"Bad request: {e}"})
+            return
+        
+        start_time = time.perf_counter()
+        try:
+            results = self.service.query(queries, top_k, hybrid, expand, rerank, fetch_factor)
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+            return
+        elapsed_ms = 1000 * (time.perf_counter() - start_time)
+        self.send_json(200, {"results": results, "elapsed_ms": elapsed_ms})
+        mode = "hybrid" if hybrid else "vector"
+        print(f"{len(queries)} {mode} queries, top_k={top_k}: {elapsed_ms:.1f} ms")
+        if rerank:
+            print(f"  {self.service.reranker.report()}")
+    
+    def log_message(self, format, *args):
+        # Each request is logged with its timing in do_POST instead
+        pass
+
+def serve(db_path=DEFAULT_DB_DIRECTORY, host="127.0.0.1", port=8088, use_cache=True):
+    """Serve retrieval requests over HTTP from one long-lived RetrievalService.
+    
+    POST /retrieve takes a JSON body of {"queries": [...], "top_k": 5} (or a
+    single "query") with optional hybrid, expand, rerank and fetch_factor
+    fields; retrieve --server sends its queries to such a server.
+    """
+    RetrievalHandler.service = get_retrieval_service(db_path, use_cache)
+    server = ThreadingHTTPServer((host, port), RetrievalHandler)
+    print(f"Serving {db_path} ({RetrievalHandler.service.collection.count()} chunks) "
+          f"on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
 
 def reset_db(db_path=DEFAULT_DB_DIRECTORY):
     """Reset the ChromaDB database by deleting and recreating it."""
@@ -289,27 +1172,40 @@ def reset_db(db_path=DEFAULT_DB_DIRECTORY):
     except (InvalidCollectionException, ValueError) as e:
         print(f"Collection '{COLLECTION_NAME}' doesn't exist or already deleted")
     
+    lexical_file = os.path.join(db_path, LEXICAL_INDEX_FILE)
+    if os.path.exists(lexical_file):
+        os.remove(lexical_file)
+    
     # Recreate an empty collection
     embedding_function = create_openai_ef()
     get_collection(client, embedding_function)
     print(f"Created a new empty collection '{COLLECTION_NAME}'")
 
 def view_chunks(chunk_file):
-    """Display all chunks from a JSON file in a human-readable format."""
+    """Display all chunks from a chunk file in a human-readable format."""
+    count = 0
     try:
-        with open(chunk_file, 'r') as f:
-            chunks = json.load(f)
-    except Exception as e:
+        for chunk in iter_chunks(chunk_file):
+            print(f"=== {chunk['relpath']} [{chunk['start_line']}:{chunk['end_line']}:{chunk['length']}] ===\n")
+            print(chunk['content'])
+            print()  # Extra newline for separation
+            count += 1
+    except (OSError, ValueError) as e:
         print(f"Error loading chunks from {chunk_file}: {e}")
         sys.exit(1)
     
-    print(f"Loaded {len(chunks)} chunks from {chunk_file}")
-    print()
+    print(f"Displayed {count} chunks from {chunk_file}")
+
+def chunk_file_for(codebase):
+    """Chunk file of a codebase: <codebase>.jsonl, or a legacy <codebase>.json.
     
-    for chunk in chunks:
-        print(f"=== {chunk['relpath']} [{chunk['start_line']}:{chunk['end_line']}:{chunk['length']}] ===\n")
-        print(chunk['content'])
-        print()  # Extra newline for separation
+    Both JSON Lines (see chunk_store.py) and JSON-array files are accepted.
+    """
+    chunk_file = f"{codebase}.jsonl"
+    legacy_file = f"{codebase}.json"
+    if not os.path.exists(chunk_file) and os.path.exists(legacy_file):
+        return legacy_file
+    return chunk_file
 
 def get_base_name(path):
     """Extract base name from a path, without extension."""
@@ -320,21 +1216,54 @@ def main():
     subparsers = parser.add_subparsers(dest="command", help="Command to execute")
     
     # Chunk command
-    chunk_parser = subparsers.add_parser("chunk", help="Process source tree and save chunks to JSON")
+    chunk_parser = subparsers.add_parser("chunk", help="Process source tree and save chunks to JSONL")
     chunk_parser.add_argument("source_dir", help="Path to source directory")
-    chunk_parser.add_argument("output_file", nargs='?', help="Output JSON file path (default: <source_dir_basename>.json)")
+    chunk_parser.add_argument("output_file", nargs='?', help="Output JSONL file path (default: <source_dir_basename>.jsonl)")
     chunk_parser.add_argument("-l", "--language", choices=["c", "python"], default="c",
                                 help="Source code language (default: c)")
+    chunk_parser.add_argument("-j", "--jobs", type=int, default=1,
+                                help="Number of worker processes (default: 1)")
+    chunk_parser.add_argument("--full", action="store_true",
+                                help="Ignore the manifest and re-chunk every file")
     
     # Index command
-    index_parser = subparsers.add_parser("index", help="Index chunks from codebase.json file to ChromaDB")
-    index_parser.add_argument("codebase", help="Codebase name (will use <codebase>.json for chunks)")
+    index_parser = subparsers.add_parser("index", help="Index chunks from codebase.jsonl file to ChromaDB")
+    index_parser.add_argument("codebase", help="Codebase name (will use <codebase>.jsonl for chunks)")
+    index_parser.add_argument("--incremental", action="store_true",
+                                help="Only embed chunks not yet in the collection and delete vanished ones")
+    index_parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                                help=f"Embedding requests in flight (default: {DEFAULT_CONCURRENCY})")
+    index_parser.add_argument("--batch-tokens", type=int, default=DEFAULT_BATCH_TOKENS,
+                                help=f"Estimated tokens per embedding request (default: {DEFAULT_BATCH_TOKENS})")
+    index_parser.add_argument("--api-base", help="OpenAI-compatible API base URL (default: $OPENAI_BASE_URL or OpenAI)")
+    index_parser.add_argument("--no-cache", action="store_true", help="Do not use the embedding cache")
     
     # Retrieve command
     retrieve_parser = subparsers.add_parser("retrieve", help="Retrieve chunks based on query")
     retrieve_parser.add_argument("codebase", help="Codebase name (will use <codebase>.db)")
-    retrieve_parser.add_argument("query", help="Query string for retrieval")
+    retrieve_parser.add_argument("query", nargs='?', help="Query string for retrieval")
+    retrieve_parser.add_argument("-f", "--queries-file",
+                                help="Retrieve for every query in this file (one per line) in one batch")
     retrieve_parser.add_argument("-k", "--top-k", type=int, default=5, help="Number of results to return")
+    retrieve_parser.add_argument("--no-cache", action="store_true", help="Do not use the embedding cache")
+    retrieve_parser.add_argument("--hybrid", action="store_true",
+                                help="Fuse vector search with the BM25 lexical index")
+    retrieve_parser.add_argument("--expand", type=int, default=0, metavar="TOKENS",
+                                help="Add callers and callees of the results, up to TOKENS "
+                                     "estimated tokens per query (default: 0, off)")
+    retrieve_parser.add_argument("--rerank", action="store_true",
+                                help="Rerank over-fetched candidates with local features")
+    retrieve_parser.add_argument("--fetch-factor", type=int, default=RERANK_FETCH_FACTOR,
+                                help=f"With --rerank, fetch this many times top-k candidates "
+                                     f"(default: {RERANK_FETCH_FACTOR})")
+    retrieve_parser.add_argument("--server", help="URL of a 'code-rag.py serve' process to query instead")
+    
+    # Serve command
+    serve_parser = subparsers.add_parser("serve", help="Serve retrieval requests over HTTP")
+    serve_parser.add_argument("codebase", help="Codebase name (will use <codebase>.db)")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address to bind (default: 127.0.0.1)")
+    serve_parser.add_argument("--port", type=int, default=8088, help="Port to listen on (default: 8088)")
+    serve_parser.add_argument("--no-cache", action="store_true", help="Do not use the embedding cache")
     
     # Reset command
     resetdb_parser = subparsers.add_parser("resetdb", help="Reset the ChromaDB database")
@@ -342,7 +1271,7 @@ def main():
     
     # View command
     view_parser = subparsers.add_parser("view", help="Display chunks in human-readable format")
-    view_parser.add_argument("codebase", help="Codebase name (will use <codebase>.json)")
+    view_parser.add_argument("codebase", help="Codebase name (will use <codebase>.jsonl)")
     
     args = parser.parse_args()
     
@@ -351,29 +1280,54 @@ def main():
         return
     
     if args.command == "chunk":
-        # If output_file is not specified, use source_dir basename + .json
+        # If output_file is not specified, use source_dir basename + .jsonl
         output_file = args.output_file
         if output_file is None:
             # Extract the base name from source_dir
             base_name = get_base_name(args.source_dir)
-            output_file = f"{base_name}.json"
+            output_file = f"{base_name}.jsonl"
         
-        chunk_source_tree(args.source_dir, output_file, args.language)
+        chunk_source_tree(args.source_dir, output_file, args.language, args.jobs, args.full)
     
     elif args.command == "index":
         # Construct the chunk file path from codebase name
-        chunk_file = f"{args.codebase}.json"
+        chunk_file = chunk_file_for(args.codebase)
         # Use codebase name + .db as the db_path
         db_path = f"{args.codebase}.db"
         
-        index_chunks(chunk_file, db_path)
+        index_chunks(chunk_file, db_path, args.incremental,
+                     args.concurrency, args.batch_tokens, args.api_base, not args.no_cache)
     
     elif args.command == "retrieve":
         # Use codebase + .db as the db_path
         db_path = f"{args.codebase}.db"
         
-        results = retrieve_chunks(args.query, args.top_k, db_path)
-        print(json.dumps(results, indent=2))
+        if (args.query is None) == (args.queries_file is None):
+            retrieve_parser.error("give either a query or --queries-file")
+        queries = load_queries(args.queries_file) if args.queries_file else [args.query]
+        
+        if args.server:
+            try:
+                results = retrieve_remote(args.server, queries, args.top_k, args.hybrid, args.expand,
+                                          args.rerank, args.fetch_factor)
+            except OSError as e:
+                print(f"Error querying retrieval server {args.server}: {e}")
+                sys.exit(1)
+        else:
+            results = retrieve_many(queries, args.top_k, db_path, not args.no_cache, args.hybrid,
+                                    args.expand, args.rerank, args.fetch_factor)
+        
+        if args.queries_file:
+            print(json.dumps([{"query": query, "results": query_results}
+                              for query, query_results in zip(queries, results)], indent=2))
+        else:
+            print(json.dumps(results[0], indent=2))
+    
+    elif args.command == "serve":
+        # Use codebase + .db as the db_path
+        db_path = f"{args.codebase}.db"
+        
+        serve(db_path, args.host, args.port, not args.no_cache)
     
     elif args.command == "resetdb":
         # Use codebase + .db as the db_path
@@ -382,8 +1336,8 @@ def main():
         reset_db(db_path)
         
     elif args.command == "view":
-        # Use codebase + .json as the chunk file path
-        chunk_file = f"{args.codebase}.json"
+        # Use codebase + .jsonl as the chunk file path
+        chunk_file = chunk_file_for(args.codebase)
         
         view_chunks(chunk_file)
 
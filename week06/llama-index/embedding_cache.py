@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Persistent embedding cache shared across indexing and retrieval runs.
+
+Embeddings are stored in a SQLite database keyed by (model name, SHA-256 of the
+text), so a text that was embedded once with a model is never sent to the API
+again, whichever script asks for it. Vectors are stored as float32 blobs. The
+model name includes where the model runs ("openai/text-embedding-ada-002",
+"ollama/nomic-embed-text" for the default local Ollama, the server URL for
+any other endpoint), so different servers never share vectors.
+
+The default location is ~/.cache/inclass/embeddings.sqlite3; set the
+EMBEDDING_CACHE_PATH environment variable to use another file.
+
+Usage:
+    cache = EmbeddingCache()
+    vectors = cache.embed("openai/text-embedding-ada-002", texts, call_the_api)
+    print(cache.report())
+
+    python embedding_cache.py [<cache-file>]    # print cache statistics
+"""
+
+import os
+import sys
+import sqlite3
+import hashlib
+import threading
+from array import array
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "inclass", "embeddings.sqlite3")
+
+# Stay below SQLite's limit on parameters per statement
+LOOKUP_BATCH_SIZE = 500
+
+def text_hash(text):
+    """SHA-256 digest of a text, the cache key within a model."""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+class EmbeddingCache:
+    """SQLite-backed map from (model, text) to an embedding vector.
+
+    One instance can be shared by several threads; several processes can use
+    the same file at once.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        # WAL lets readers in other processes proceed while one process writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                   model TEXT NOT NULL,
+                   text_hash BLOB NOT NULL,
+                   vector BLOB NOT NULL,
+                   PRIMARY KEY (model, text_hash)
+               ) WITHOUT ROWID"""
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model, texts):
+        """Return a list with the cached embedding of each text, or None where missing."""
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            for i in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+                batch = hashes[i:i + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                )
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+
+        results = [found.get(key) for key in hashes]
+        hits = sum(result is not None for result in results)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def put_many(self, model, texts, embeddings):
+        """Store the embeddings of texts for model."""
+        rows = [
+            (model, text_hash(text), array("f", embedding).tobytes())
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def get(self, model, text):
+        """Return the cached embedding of one text, or None."""
+        return self.get_many(model, [text])[0]
+
+    def put(self, model, text, embedding):
+        """Store the embedding of one text."""
+        self.put_many(model, [text], [embedding])
+
+    def embed(self, model, texts, embed_fn):
+        """Return embeddings for texts, calling embed_fn(list of texts) only for cache misses."""
+        embeddings = self.get_many(model, texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            # Embed each distinct missing text once
+            missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+            # Embedding functions may return numpy arrays; keep plain float lists
+            new_embeddings = [[float(v) for v in embedding] for embedding in embed_fn(missing_texts)]
+            self.put_many(model, missing_texts, new_embeddings)
+            by_text = dict(zip(missing_texts, new_embeddings))
+            for i in missing:
+                embeddings[i] = by_text[texts[i]]
+        return embeddings
+
+    def report(self):
+        """One-line summary of this instance's hits and misses."""
+        total = self.hits + self.misses
+        rate = 100 * self.hits / total if total else 0.0
+        return f"Embedding cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    cache = EmbeddingCache(path)
+    print(f"Cache file: {cache.path} ({os.path.getsize(cache.path) / 1e6:.2f} MB)")
+    rows = cache._conn.execute(
+        "SELECT model, COUNT(*), SUM(LENGTH(vector)) FROM embeddings GROUP BY model ORDER BY model"
+    )
+    for model, count, size in rows:
+        print(f"  {model}: {count} embeddings ({size / 1e6:.2f} MB)")
+    cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Identifier-aware BM25 index over code chunks.
+
+Embeddings are good at paraphrases but weak at exact identifiers such as
+sys_fork or uvmcopy. This index tokenizes code so that identifiers match
+exactly and by their parts: "sys_fork" yields the tokens sys_fork, sys and
+fork, and "allocProc" yields allocproc, alloc and proc. Chunks are ranked
+with BM25.
+
+The index is built from (chunk id, content) pairs and saved as JSON. Queries
+score only the postings of their own terms, accumulated with numpy.
+
+Usage:
+    index = LexicalIndex.build((chunk["id"], chunk["content"]) for chunk in chunks)
+    index.save("lexical-index.json")
+    index = LexicalIndex.load("lexical-index.json")
+    index.search("where is sys_fork implemented", top_k=10)   # [(chunk id, score), ...]
+"""
+
+import re
+import json
+import math
+
+import numpy as np
+
+VERSION = 1
+
+IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+# Words inside an identifier piece: "HTTPServer" -> HTTP, Server; "allocProc" -> alloc, Proc
+SUBWORD_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+def tokenize(text):
+    """Lowercased identifiers of text, each followed by its parts if it has several."""
+    tokens = []
+    for identifier in IDENTIFIER_RE.findall(text):
+        tokens.append(identifier.lower())
+        parts = [part.lower()
+                 for piece in identifier.split("_")
+                 for part in SUBWORD_RE.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+class LexicalIndex:
+    """BM25 inverted index from tokens to chunk ids."""
+
+    def __init__(self, ids, doc_lengths, postings, k1=1.2, b=0.75):
+        """
+        ids: chunk id of each document, in document number order
+        doc_lengths: number of tokens in each document
+        postings: term -> (document numbers, term frequencies), as int arrays
+        """
+        self.ids = ids
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.avg_length = float(self.doc_lengths.mean()) if len(ids) else 0.0
+        self.doc_numbers = {chunk_id: doc for doc, chunk_id in enumerate(ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, documents, k1=1.2, b=0.75):
+        """Build an index from an iterable of (chunk id, text) pairs."""
+        ids = []
+        doc_lengths = []
+        term_docs = {}
+        term_tfs = {}
+        for doc, (chunk_id, text) in enumerate(documents):
+            tokens = tokenize(text)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                term_docs.setdefault(token, []).append(doc)
+                term_tfs.setdefault(token, []).append(tf)
+            ids.append(chunk_id)
+            doc_lengths.append(len(tokens))
+
+        postings = {
+            term: (np.asarray(docs, dtype=np.int32), np.asarray(term_tfs[term], dtype=np.float32))
+            for term, docs in term_docs.items()
+        }
+        return cls(ids, doc_lengths, postings, k1, b)
+
+    def save(self, path):
+        """Write the index to a JSON file."""
+        data = {
+            "version": VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "ids": self.ids,
+            "doc_lengths": self.doc_lengths.astype(int).tolist(),
+            "postings": {
+                term: [docs.tolist(), tfs.astype(int).tolist()]
+                for term, (docs, tfs) in self.postings.items()
+            },
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save."""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} lexical index")
+        postings = {
+            term: (np.asarray(docs, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for term, (docs, tfs) in data["postings"].items()
+        }
+        return cls(data["ids"], data["doc_lengths"], postings, data["k1"], data["b"])
+
+    def idf(self, term):
+        """BM25 inverse document frequency (always positive)."""
+        df = len(self.postings[term][0])
+        return math.log(1.0 + (len(self.ids) - df + 0.5) / (df + 0.5))
+
+    def query_terms(self, query):
+        """Distinct tokens of the query that occur in the index.
+
+        A plural that does not occur is replaced by its singular ("pipes" -> "pipe").
+        """
+        terms = []
+        for term in tokenize(query):
+            if term not in self.postings and term.endswith("s") and term[:-1] in self.postings:
+                term = term[:-1]
+            if term in self.postings and term not in terms:
+                terms.append(term)
+        return terms
+
+    def length_norm(self, docs):
+        """BM25 document length normalization of documents (an int array)."""
+        return self.k1 * (1.0 - self.b + self.b * self.doc_lengths[docs] / max(self.avg_length, 1e-9))
+
+    def scores(self, query):
+        """BM25 score of every document for the query, as a numpy array."""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        length_norm = self.length_norm(slice(None))
+        for term in self.query_terms(query):
+            docs, tfs = self.postings[term]
+            scores[docs] += self.idf(term) * tfs * (self.k1 + 1.0) / (tfs + length_norm[docs])
+        return scores
+
+    def term_frequencies(self, terms, chunk_ids):
+        """Matrix of the frequency of each term (rows) in each chunk (columns).
+
+        Chunks not in the index have all-zero columns. Postings are sorted by
+        document number, so each row is filled with one searchsorted.
+        """
+        docs = np.array([self.doc_numbers.get(chunk_id, -1) for chunk_id in chunk_ids], dtype=np.int64)
+        tf = np.zeros((len(terms), len(docs)), dtype=np.float32)
+        for row, term in enumerate(terms):
+            posting_docs, posting_tfs = self.postings[term]
+            positions = np.minimum(np.searchsorted(posting_docs, docs), len(posting_docs) - 1)
+            found = posting_docs[positions] == docs
+            tf[row, found] = posting_tfs[positions[found]]
+        return tf, docs
+
+    def candidate_scores(self, terms, tf, docs):
+        """BM25 scores of chunks from the output of term_frequencies."""
+        if not terms:
+            return np.zeros(len(docs), dtype=np.float32)
+        idf = np.array([self.idf(term) for term in terms], dtype=np.float32)
+        length_norm = self.length_norm(np.maximum(docs, 0))
+        return idf @ (tf * (self.k1 + 1.0) / (tf + length_norm))
+
+    def search(self, query, top_k=10):
+        """Return the top_k (chunk id, score) pairs for the query, best first."""
+        if not self.ids or top_k <= 0:
+            return []
+        scores = self.scores(query)
+        top_k = min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] > 0]
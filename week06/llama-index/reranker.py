@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Local reranking of retrieval candidates with cheap features.
+
+The first stage (vector or hybrid search) over-fetches candidates, for
+example 50 for a top-5 query. The reranker scores them with features that
+need no model calls and keeps the best top_k:
+
+    first_stage         position in the first-stage ranking (1 for the first, 0 for the last)
+    bm25                BM25 score of the chunk for the query, relative to the best candidate
+    identifier_overlap  IDF-weighted share of the query's identifiers found in the chunk
+    path_overlap        share of the query's identifiers that are components of the chunk's path
+    length              log of the chunk's line count, capped at 1, so one-line fragments rank lower
+
+The lexical features come from the postings of the BM25 index (lexical_index.py),
+so no chunk text is tokenized at query time. The score is the feature matrix
+times a weight vector, computed with numpy for all candidates at once.
+
+Usage:
+    reranker = Reranker(lexical_index)
+    results = reranker.rerank(query, candidates, top_k=5)
+    print(reranker.report())
+"""
+
+import re
+import math
+import time
+
+import numpy as np
+
+FEATURES = ("first_stage", "bm25", "identifier_overlap", "path_overlap", "length")
+DEFAULT_WEIGHTS = np.array([1.0, 0.6, 0.8, 0.3, 0.3], dtype=np.float32)
+
+# Chunks of this many lines or more get the full length feature
+FULL_LENGTH_LINES = 20
+
+# Path components: "kernel/fs.c" -> kernel, fs, c
+PATH_SPLIT_RE = re.compile(r"[^a-z0-9]+")
+
+class Reranker:
+    """Rerank candidate chunks (result dictionaries with id, relpath, length)."""
+
+    def __init__(self, lexical=None, weights=DEFAULT_WEIGHTS):
+        """lexical is a LexicalIndex; without one the lexical features are 0."""
+        self.lexical = lexical
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.queries = 0
+        self.candidates = 0
+        self.seconds = 0.0
+
+    def features(self, query, candidates):
+        """Feature matrix of the candidates: one row per candidate, one column per FEATURES entry."""
+        n = len(candidates)
+        features = np.zeros((n, len(FEATURES)), dtype=np.float32)
+        if n == 0:
+            return features
+
+        features[:, 0] = 1.0 - np.arange(n, dtype=np.float32) / n
+
+        lines = np.array([candidate["length"] for candidate in candidates], dtype=np.float32)
+        features[:, 4] = np.minimum(np.log1p(np.maximum(lines, 0)) / math.log1p(FULL_LENGTH_LINES), 1.0)
+
+        if self.lexical is None:
+            return features
+        terms = self.lexical.query_terms(query)
+        if not terms:
+            return features
+
+        tf, docs = self.lexical.term_frequencies(terms, [candidate["id"] for candidate in candidates])
+        bm25 = self.lexical.candidate_scores(terms, tf, docs)
+        if bm25.max() > 0:
+            features[:, 1] = bm25 / bm25.max()
+
+        idf = np.array([self.lexical.idf(term) for term in terms], dtype=np.float32)
+        features[:, 2] = idf @ (tf > 0).astype(np.float32) / idf.sum()
+
+        paths = [set(PATH_SPLIT_RE.split(candidate["relpath"].lower())) for candidate in candidates]
+        in_path = np.array([[term in path for path in paths] for term in terms], dtype=np.float32)
+        features[:, 3] = in_path.mean(axis=0)
+        return features
+
+    def rerank(self, query, candidates, top_k=5):
+        """Return the top_k candidates by weighted feature score, best first."""
+        start_time = time.perf_counter()
+        scores = self.features(query, candidates) @ self.weights
+        # Stable sort keeps the first-stage order among equal scores
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        self.seconds += time.perf_counter() - start_time
+        self.queries += 1
+        self.candidates += len(candidates)
+        return [candidates[i] for i in order]
+
+    def report(self):
+        """One-line summary of the time spent reranking."""
+        if not self.queries:
+            return "Rerank: no queries"
+        return (f"Rerank: {self.queries} queries, {self.candidates / self.queries:.0f} candidates "
+                f"per query, {1000 * self.seconds / self.queries:.2f} ms per query")
@@ -3,22 +3,31 @@
 Retrieval Performance Evaluation Tool
 
 This script evaluates retrieval performance by running multiple test prompts against a codebase
-and calculating average recall, precision, and F1 scores.
+and calculating average recall, precision, and F1 scores. All prompts are retrieved in one
+batched call to retrieve_many. Each prompt is then retrieved once more on its own to report
+the p50 and p95 per-query latency; the query embeddings are cached by then, so this measures
+the search itself. --hybrid evaluates hybrid BM25 + vector retrieval, --rerank reranks
+--fetch-factor times top-K candidates with local features (and reports the time it takes),
+and --expand adds call-graph neighbours of the results within a token budget.
 
 Usage:
-    python retrieval-perf.py <codebase> [-k <top-K>]
+    python retrieval-perf.py <codebase> [-k <top-K>] [--hybrid] [--rerank] [--fetch-factor <N>]
+                             [--expand <tokens>]
 """
 
 import json
 import sys
 import os
 import glob
+import math
+import time
 import argparse
 from pathlib import Path
 
-# Import retrieve_chunks from code-rag.py
+# Import the retrieval functions and the chunk store from code-rag.py
 try:
-    from code_rag import retrieve_chunks
+    from code_rag import (retrieve_chunks, retrieve_many, get_retrieval_service, chunk_store,
+                          RERANK_FETCH_FACTOR)
 except ImportError:
     import importlib.util
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -28,11 +37,14 @@ except ImportError:
     code_rag = importlib.util.module_from_spec(spec)
     spec.loader.exec_module(code_rag)
     retrieve_chunks = code_rag.retrieve_chunks
+    retrieve_many = code_rag.retrieve_many
+    get_retrieval_service = code_rag.get_retrieval_service
+    chunk_store = code_rag.chunk_store
+    RERANK_FETCH_FACTOR = code_rag.RERANK_FETCH_FACTOR
 
 def load_chunks(filename):
-    """Load chunks from a JSON file."""
-    with open(filename, 'r') as f:
-        return json.load(f)
+    """Load chunks from a JSONL or JSON-array chunk file."""
+    return chunk_store.load_chunks(filename)
 
 def get_file_line_mapping(chunks):
     """
@@ -151,8 +163,23 @@ def find_prompt_files(codebase_dir):
     
     return sorted(prompt_files)
 
-def process_prompt_file(prompt_file, top_k):
-    """Process a single prompt file, retrieve chunks, and return metrics."""
+def load_prompt(prompt_file):
+    """Load the prompt text from a prompt file."""
+    with open(prompt_file, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
+def percentile(values, p):
+    """The p-th percentile of values (nearest rank)."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * p / 100) - 1)]
+
+def process_prompt_file(prompt_file, top_k, results=None, hybrid=False, expand=0, rerank=False,
+                        fetch_factor=RERANK_FETCH_FACTOR):
+    """Process a single prompt file, retrieve chunks, and return metrics.
+    
+    If results is given (e.g. from a batched retrieve_many call) they are
+    used instead of retrieving the prompt on its own.
+    """
     # Extract codebase and question number
     base_name = os.path.basename(prompt_file)
     codebase_dir = os.path.dirname(prompt_file)
@@ -162,8 +189,7 @@ def process_prompt_file(prompt_file, top_k):
     q_file_base = os.path.splitext(base_name)[0]
     
     # Load prompt text
-    with open(prompt_file, 'r', encoding='utf-8') as f:
-        prompt_text = f.read().strip()
+    prompt_text = load_prompt(prompt_file)
     
     print(f"\nProcessing prompt: {prompt_file}")
     print(f"Query: {prompt_text}")
@@ -179,9 +205,11 @@ def process_prompt_file(prompt_file, top_k):
     # Generate test file path
     test_file = os.path.join(codebase_dir, f"{q_file_base}-test.json")
     
-    # Use retrieve_chunks to get results
-    db_path = f"{codebase_name}.db"
-    results = retrieve_chunks(prompt_text, top_k, db_path)
+    # Use retrieve_chunks to get results unless they were retrieved in a batch
+    if results is None:
+        db_path = f"{codebase_name}.db"
+        results = retrieve_chunks(prompt_text, top_k, db_path, hybrid=hybrid, expand=expand,
+                                  rerank=rerank, fetch_factor=fetch_factor)
     
     # Save results to test file
     with open(test_file, 'w', encoding='utf-8') as f:
@@ -207,6 +235,14 @@ def main():
     parser = argparse.ArgumentParser(description="Evaluate retrieval performance for a codebase.")
     parser.add_argument("codebase", help="Codebase directory to process")
     parser.add_argument("-k", "--top-k", type=int, default=5, help="Number of top results to retrieve")
+    parser.add_argument("--hybrid", action="store_true",
+                        help="Use hybrid BM25 + vector retrieval")
+    parser.add_argument("--expand", type=int, default=0, metavar="TOKENS",
+                        help="Add call-graph neighbours of the results, up to TOKENS per prompt")
+    parser.add_argument("--rerank", action="store_true",
+                        help="Rerank over-fetched candidates with local features")
+    parser.add_argument("--fetch-factor", type=int, default=RERANK_FETCH_FACTOR,
+                        help=f"With --rerank, candidates per result to fetch (default: {RERANK_FETCH_FACTOR})")
     
     # Handle the old command line format as well
     if len(sys.argv) == 3 and '.json' in sys.argv[1] and '.json' in sys.argv[2]:
@@ -252,11 +288,35 @@ def main():
     for i, file in enumerate(prompt_files):
         print(f"  {i+1}. {os.path.basename(file)}")
     
+    # Retrieve chunks for all prompts in one batch
+    codebase_name = os.path.basename(prompt_files[0]).split('-q')[0]
+    prompts = [load_prompt(prompt_file) for prompt_file in prompt_files]
+    start_time = time.perf_counter()
+    db_path = f"{codebase_name}.db"
+    options = {"hybrid": args.hybrid, "expand": args.expand,
+               "rerank": args.rerank, "fetch_factor": args.fetch_factor}
+    all_results = retrieve_many(prompts, args.top_k, db_path, **options)
+    elapsed = time.perf_counter() - start_time
+    mode = "hybrid" if args.hybrid else "vector"
+    if args.rerank:
+        mode += f", reranking {args.top_k * args.fetch_factor} candidates"
+    if args.expand:
+        mode += f", expanded by up to {args.expand} tokens"
+    print(f"\nRetrieved {len(prompts)} prompts ({mode}) in {elapsed:.2f} s "
+          f"({1000 * elapsed / len(prompts):.1f} ms per prompt)")
+    
+    # Per-query latency with a warm service and cached query embeddings
+    latencies = []
+    for prompt in prompts:
+        start_time = time.perf_counter()
+        retrieve_chunks(prompt, args.top_k, db_path, **options)
+        latencies.append(1000 * (time.perf_counter() - start_time))
+    
     # Process each prompt file and collect metrics
     all_metrics = []
     
-    for prompt_file in prompt_files:
-        metrics = process_prompt_file(prompt_file, args.top_k)
+    for prompt_file, results in zip(prompt_files, all_results):
+        metrics = process_prompt_file(prompt_file, args.top_k, results, **options)
         if metrics:
             all_metrics.append(metrics)
     
@@ -271,6 +331,10 @@ def main():
         print(f"  Average Recall: {avg_recall:.4f}")
         print(f"  Average Precision: {avg_precision:.4f}")
         print(f"  Average F1: {avg_f1:.4f}")
+        print(f"  Latency: p50 {percentile(latencies, 50):.1f} ms, "
+              f"p95 {percentile(latencies, 95):.1f} ms")
+        if args.rerank:
+            print(f"  {get_retrieval_service(db_path).reranker.report()}")
         print("=" * 50)
     else:
         print("\nNo metrics were calculated. Check that the ground truth files exist.")
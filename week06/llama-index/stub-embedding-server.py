@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Stub OpenAI embedding server for testing code-rag.py without API calls.
+
+Serves POST /v1/embeddings in the OpenAI format. Each text is embedded by
+hashing every word into several of a fixed number of dimensions, so results
+are deterministic and texts sharing words get similar vectors. The server can add
+latency to every request and answer a fraction of requests with HTTP 429 to
+exercise the indexer's concurrency and retry logic.
+
+Usage:
+    python stub-embedding-server.py [--port 8000] [--dim 1536] [--latency 0.2] [--rate-limit 0.1]
+
+Example:
+    python stub-embedding-server.py --latency 0.5 --rate-limit 0.2 &
+    export OPENAI_API_KEY=stub
+    python code-rag.py index xv6-riscv --api-base http://localhost:8000/v1
+"""
+
+import re
+import sys
+import json
+import math
+import time
+import zlib
+import base64
+import random
+import struct
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+
+# Each word is spread over this many dimensions. One dimension per word makes
+# most vectors orthogonal, which degrades ChromaDB's HNSW graph search.
+BUCKETS_PER_WORD = 32
+
+def embed_text(text, dim):
+    """Embed text by hashing each word into signed buckets, L2-normalized."""
+    vector = [0.0] * dim
+    # Real embeddings are never zero; a text without words (e.g. "}") is
+    # hashed as a whole so ChromaDB's L2 ranking is not dominated by zero vectors
+    words = WORD_RE.findall(text.lower()) or [text]
+    for word in words:
+        encoded = word.encode("utf-8")
+        for seed in range(BUCKETS_PER_WORD):
+            h = zlib.crc32(encoded, seed)
+            vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+class EmbeddingHandler(BaseHTTPRequestHandler):
+    # Set from the command line in main()
+    dim = 1536
+    latency = 0.0
+    rate_limit = 0.0
+    stats = {"requests": 0, "texts": 0, "rate_limited": 0}
+    stats_lock = threading.Lock()
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/v1/embeddings", "/embeddings"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        texts = request["input"]
+        if isinstance(texts, str):
+            texts = [texts]
+
+        if random.random() < self.rate_limit:
+            with self.stats_lock:
+                self.stats["rate_limited"] += 1
+            self.send_json(429, {"error": {"message": "Rate limit reached (stub)",
+                                           "type": "requests", "code": "rate_limit_exceeded"}},
+                           headers={"Retry-After": "0.2"})
+            return
+
+        time.sleep(self.latency)
+        data = []
+        for i, text in enumerate(texts):
+            vector = embed_text(text, self.dim)
+            if request.get("encoding_format") == "base64":
+                # The openai client asks for little-endian float32 in base64 by default
+                vector = base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+
+        tokens = sum(len(text) // 4 + 1 for text in texts)
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            self.stats["texts"] += len(texts)
+        self.send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "stub"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def log_message(self, format, *args):
+        # Keep the console quiet; totals are printed on shutdown
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible embedding server")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    parser.add_argument("--dim", type=int, default=1536, help="Embedding dimension (default: 1536)")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds to sleep before answering each request (default: 0)")
+    parser.add_argument("--rate-limit", type=float, default=0.0,
+                        help="Fraction of requests answered with HTTP 429 (default: 0)")
+    args = parser.parse_args()
+
+    EmbeddingHandler.dim = args.dim
+    EmbeddingHandler.latency = args.latency
+    EmbeddingHandler.rate_limit = args.rate_limit
+
+    server = ThreadingHTTPServer((args.host, args.port), EmbeddingHandler)
+    print(f"Stub embedding server on http://{args.host}:{args.port}/v1 (dim={args.dim})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        stats = EmbeddingHandler.stats
+        print(f"\nServed {stats['requests']} requests ({stats['texts']} texts), "
+              f"rate-limited {stats['rate_limited']}")
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -5,15 +5,43 @@ This program shows how to:
 1. Connect to the Ollama API
 2. Generate embeddings for text
 3. Compare similarity between different text embeddings
+
+Embeddings are stored in the persistent cache from
+../llama-index/embedding_cache.py when it is available, so running the demo
+again does not call Ollama for texts it has already embedded.
 """
 
+import os
 import requests
 import numpy as np
 from typing import List, Dict, Any
 import json
+import importlib.util
 
 # Ollama API endpoint for embeddings
 OLLAMA_API_URL = "http://localhost:11434/api/embed"
+DEFAULT_OLLAMA_API_URL = "http://localhost:11434/api/embed"
+
+# Optional embedding cache shared with week06/llama-index
+try:
+    _cache_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "..", "llama-index", "embedding_cache.py")
+    _spec = importlib.util.spec_from_file_location("embedding_cache", _cache_path)
+    embedding_cache = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(embedding_cache)
+    EMBEDDING_CACHE = embedding_cache.EmbeddingCache()
+except Exception as e:
+    print(f"Embedding cache not available ({e}); embeddings will not be cached.")
+    EMBEDDING_CACHE = None
+
+def embedding_cache_key(model: str) -> str:
+    """Model name under which embeddings from OLLAMA_API_URL are cached.
+    
+    The server is part of the key, so two Ollama hosts serving different
+    builds of the same model tag never share vectors.
+    """
+    server = "ollama" if OLLAMA_API_URL == DEFAULT_OLLAMA_API_URL else OLLAMA_API_URL
+    return f"{server}/{model}"
 
 def get_embedding(text: str, model: str = "jina/jina-embeddings-v2-base-en:latest") -> List[float]:
     """
@@ -26,6 +54,13 @@ def get_embedding(text: str, model: str = "jina/jina-embeddings-v2-base-en:lates
     Returns:
         A list of floats representing the embedding vector
     """
+    cache_model = embedding_cache_key(model)
+    if EMBEDDING_CACHE is not None:
+        cached = EMBEDDING_CACHE.get(cache_model, text)
+        if cached is not None:
+            # Same shape as the API response: a list holding one embedding
+            return [cached]
+    
     payload = {
         "model": model,
         "input": text
@@ -41,7 +76,9 @@ def get_embedding(text: str, model: str = "jina/jina-embeddings-v2-base-en:lates
         if "embeddings" not in result:
             print(f"Warning: API response does not contain 'embeddings' key. Response: {result}")
             return []
-            
+        
+        if EMBEDDING_CACHE is not None and result["embeddings"]:
+            EMBEDDING_CACHE.put(cache_model, text, result["embeddings"][0])
         return result["embeddings"]
     except requests.exceptions.RequestException as e:
         print(f"Error calling Ollama API: {e}")